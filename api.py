@@ -0,0 +1,267 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import streamlit as st
+import tornado.web
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from cachetools import LRUCache
+
+import cosmos_pool
+import dates
+import rollups
+import single_flight
+import throttle
+from elon_tweets import data
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8502
+DEFAULT_WORKERS = 16
+VERSIONS_SIZE = 4096
+LATEST_LIMIT = 10
+# Which single-flight reuse window (and so Cache-Control max-age) each
+# endpoint follows.
+ENDPOINT_KINDS = {"latest": "latest", "date": "latest", "thread": "threads",
+                  "frequency": "counts"}
+
+# URI -> (etag, when this server first saw that body). Nothing in the data
+# says when a tweet's metrics last moved, so Last-Modified is the first
+# time a response came out different.
+_versions = LRUCache(maxsize=VERSIONS_SIZE)
+_versions_lock = threading.Lock()
+
+
+def _last_modified(uri, etag):
+    with _versions_lock:
+        seen = _versions.get(uri)
+        if seen is None or seen[0] != etag:
+            seen = (etag, datetime.now(timezone.utc).replace(microsecond=0))
+            _versions[uri] = seen
+        return seen[1]
+
+
+def tweet_json(tweet):
+    return tweet.to_doc()
+
+
+def threads_json(threads):
+    return [[tweet_json(tweet) for tweet in thread] for thread in threads]
+
+
+class ApiHandler(tornado.web.RequestHandler):
+    kind = None
+
+    def initialize(self, executor):
+        self.executor = executor
+        self.retry_after = None
+
+    def write_error(self, status_code, **kwargs):
+        self.set_header("Content-Type", "application/json")
+        if self.retry_after:
+            self.set_header("Retry-After", str(max(1, round(self.retry_after))))
+        self.finish(json.dumps({"error": self._reason}))
+
+    async def respond(self, build):
+        # Identical requests share one build (and one trip to Cosmos) for
+        # the endpoint's reuse window, whoever asks.
+        reuse_seconds = single_flight.reuse_seconds(ENDPOINT_KINDS[self.kind])
+        loop = asyncio.get_running_loop()
+        try:
+            body = await loop.run_in_executor(
+                self.executor, lambda: single_flight.shared.do(
+                    ("api", self.request.uri),
+                    lambda: json.dumps(build(), separators=(",", ":")),
+                    reuse_seconds=reuse_seconds))
+        except throttle.Throttled as e:
+            self.retry_after = e.retry_after
+            raise tornado.web.HTTPError(503, reason="Cosmos DB is throttling requests")
+
+        etag = '"' + hashlib.sha1(body.encode("utf-8")).hexdigest() + '"'
+        modified = _last_modified(self.request.uri, etag)
+        self.set_header("Content-Type", "application/json")
+        self.set_header("Cache-Control", f"public, max-age={int(reuse_seconds)}")
+        self.set_header("Last-Modified", format_datetime(modified, usegmt=True))
+        # Tagged from the body before gzip, so both encodings validate alike.
+        self.set_header("Etag", etag)
+        if self.check_etag_header() or self._not_modified_since(modified):
+            self.set_status(304)
+            return self.finish()
+        self.finish(body)
+
+    def _not_modified_since(self, modified):
+        # If-None-Match wins when both are sent.
+        since = self.request.headers.get("If-Modified-Since")
+        if not since or self.request.headers.get("If-None-Match"):
+            return False
+        try:
+            return parsedate_to_datetime(since) >= modified
+        except (TypeError, ValueError):
+            return False
+
+    def container(self):
+        try:
+            return data.get_snapshot() or cosmos_pool.get_container(st.secrets["cosmosdb"])
+        except Exception as e:
+            logger.error(f"Error initializing Cosmos DB client: {str(e)}")
+            raise tornado.web.HTTPError(503, reason="Cosmos DB is unavailable")
+
+    def flag(self, name):
+        return self.get_query_argument(name, "0").lower() in ("1", "true", "yes")
+
+
+class LatestHandler(ApiHandler):
+    # /api/tweets/latest?author=elonmusk&threads=1
+    kind = "latest"
+
+    async def get(self):
+        author = self.get_query_argument("author", None)
+        if author not in (None, "elonmusk"):
+            raise tornado.web.HTTPError(400, reason="author must be elonmusk or omitted")
+        with_threads = self.flag("threads")
+
+        def build():
+            container = self.container()
+            if author:
+                tweets = data.get_elon_tweets(container, limit=LATEST_LIMIT)
+            else:
+                tweets = data.get_last_10_tweets(container)
+            if with_threads:
+                return {"threads": threads_json(data.get_tweet_threads(container, tweets))}
+            return {"tweets": [tweet_json(tweet) for tweet in tweets]}
+
+        await self.respond(build)
+
+
+class DateHandler(ApiHandler):
+    # /api/tweets/date/2024-05-01?tz=America/Chicago&continuation=...&threads=1
+    kind = "date"
+
+    async def get(self, day):
+        try:
+            date.fromisoformat(day)
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="date must be YYYY-MM-DD")
+        tz_name = self.get_query_argument("tz", None)
+        try:
+            tz = dates.get_timezone(tz_name) if tz_name else None
+        except ValueError:
+            raise tornado.web.HTTPError(400, reason="tz must be an IANA timezone name")
+        continuation = self.get_query_argument("continuation", None)
+        with_threads = self.flag("threads")
+
+        def build():
+            container = self.container()
+            pages = data.get_tweets_on_date(container, day, tz)
+            pages.continuation = continuation
+            try:
+                tweets = throttle.shared.run(lambda: pages.load_more(container))
+            except (ValueError, CosmosHttpResponseError) as e:
+                if continuation is None or getattr(e, "status_code", 400) != 400:
+                    raise
+                raise tornado.web.HTTPError(400, reason="Invalid continuation")
+            result = {"continuation": pages.continuation}
+            if with_threads:
+                result["threads"] = threads_json(data.get_tweet_threads(container, tweets))
+            else:
+                result["tweets"] = [tweet_json(tweet) for tweet in tweets]
+            return result
+
+        await self.respond(build)
+
+
+class ThreadHandler(ApiHandler):
+    # /api/threads/<tweet id>
+    kind = "thread"
+
+    async def get(self, tweet_id):
+        def build():
+            container = self.container()
+            tweet = data.get_tweet(container, tweet_id)
+            if tweet is None:
+                raise tornado.web.HTTPError(404, reason="No such tweet")
+            threads = data.get_tweet_threads(container, [tweet])
+            return {"thread": threads_json(threads)[0]}
+
+        await self.respond(build)
+
+
+class FrequencyHandler(ApiHandler):
+    # /api/frequency?grain=day&measure=like_count&average=1
+    kind = "frequency"
+
+    async def get(self):
+        grain = self.get_query_argument("grain", "day")
+        measure = self.get_query_argument("measure", "tweets")
+        average = self.flag("average")
+        if grain not in rollups.GRAINS:
+            raise tornado.web.HTTPError(400, reason=f"grain must be one of {', '.join(rollups.GRAINS)}")
+        if measure not in rollups.FIELDS:
+            raise tornado.web.HTTPError(400, reason=f"measure must be one of {', '.join(rollups.FIELDS)}")
+
+        def build():
+            container = self.container()
+            store = data.get_rollups(container)
+            if store is not None:
+                rows = data.get_rollup_series(store, grain, measure, average)
+                return {"grain": grain, "measure": measure, "average": average,
+                        "buckets": [[bucket, value] for bucket, value in rows]}
+            # Without the rollup store only daily tweet counts exist; they
+            # are summed into weeks and months here.
+            if measure != "tweets" or average or grain in ("hour", "hour_of_week"):
+                raise tornado.web.HTTPError(
+                    404, reason="Only day, week and month tweet counts are "
+                                "available without the rollup store")
+            totals = {}
+            for day, count in data.get_daily_tweet_counts(container).items():
+                bucket = rollups.buckets(f"{day}T00")[grain]
+                totals[bucket] = totals.get(bucket, 0) + count
+            return {"grain": grain, "measure": measure, "average": False,
+                    "buckets": [[bucket, totals[bucket]] for bucket in sorted(totals)]}
+
+        await self.respond(build)
+
+
+def make_app(workers=DEFAULT_WORKERS):
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="api")
+    args = {"executor": executor}
+    return tornado.web.Application([
+        (r"/api/tweets/latest", LatestHandler, args),
+        (r"/api/tweets/date/([0-9-]+)", DateHandler, args),
+        (r"/api/threads/([0-9]+)", ThreadHandler, args),
+        (r"/api/frequency", FrequencyHandler, args),
+    ], compress_response=True)
+
+
+async def serve(address, port, workers):
+    single_flight.configure(st.secrets.get("single_flight", {}))
+    throttle.configure(st.secrets.get("throttle", {}))
+    if data.get_snapshot() is None:
+        cosmos_pool.warm_up(st.secrets["cosmosdb"])
+    app = make_app(workers)
+    app.listen(port, address=address)
+    logger.info(f"Serving the JSON API on http://{address}:{port}/api/")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve latest tweets, tweets by date, threads and "
+                    "frequency buckets as JSON, from the same secrets as the apps.")
+    parser.add_argument("--address", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="threads running blocking Cosmos DB calls")
+    args = parser.parse_args()
+    asyncio.run(serve(args.address, args.port, args.workers))
+
+
+if __name__ == "__main__":
+    main()
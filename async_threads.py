@@ -0,0 +1,236 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import threading
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+import cosmos_pool
+import models
+import queries
+import telemetry
+import thread_resolver
+import tweet_cache
+from models import Tweet
+from thread_resolver import build_thread
+
+try:
+    import aiohttp
+    from azure.core.pipeline.transport import AioHttpTransport
+    from azure.cosmos.aio import CosmosClient as AsyncCosmosClient
+except ImportError:
+    AsyncCosmosClient = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+BATCH_SIZE = 50
+TIMEOUT_SECONDS = 30
+
+_lock = threading.Lock()
+_state = {
+    "loop": None,
+    "init_lock": None,
+    "fingerprint": None,
+    "session": None,
+    "client": None,
+    "container": None,
+    "partition_key_path": None,
+}
+
+# Responses to one resolve_threads call. They arrive on the loop thread
+# and are recorded on the caller's, where its telemetry spans live.
+_responses = contextvars.ContextVar("responses", default=None)
+
+
+def available():
+    return AsyncCosmosClient is not None
+
+
+def _get_loop():
+    # One event loop per process, on its own daemon thread; Streamlit
+    # script threads hand coroutines to it and block on the result.
+    with _lock:
+        if _state["loop"] is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever,
+                             name="cosmos-async", daemon=True).start()
+            _state.update(loop=loop, init_lock=asyncio.Lock())
+        return _state["loop"]
+
+
+def _collect_response(response):
+    responses = _responses.get()
+    if responses is not None:
+        http_response = response.http_response
+        responses.append(
+            (http_response.headers, telemetry.response_size(http_response)))
+
+
+async def _get_container(settings):
+    key = cosmos_pool.fingerprint(settings)
+    async with _state["init_lock"]:
+        if _state["container"] is not None and _state["fingerprint"] == key:
+            return _state["container"]
+
+        if _state["client"] is not None:
+            await _state["client"].close()
+            await _state["session"].close()
+        # Same pool size and retry policy as the sync client: 429s come
+        # back to throttle instead of being retried inside the SDK.
+        session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=cosmos_pool.pool_size(settings)))
+        client = AsyncCosmosClient(
+            settings["COSMOS_DB_ENDPOINT"], settings["COSMOS_DB_KEY"],
+            transport=AioHttpTransport(session=session, session_owner=False),
+            connection_policy=cosmos_pool.connection_policy(settings),
+            raw_response_hook=_collect_response)
+        await client.__aenter__()
+        container = client.get_database_client(
+            settings["COSMOS_DB_DATABASE_NAME"]).get_container_client(
+            settings["COSMOS_DB_CONTAINER_NAME"])
+        properties = await container.read()
+        paths = properties.get('partitionKey', {}).get('paths', [])
+        _state.update(fingerprint=key, session=session, client=client,
+                      container=container,
+                      partition_key_path=paths[0] if len(paths) == 1 else '')
+        logger.info("Initialized async Cosmos DB client")
+        return container
+
+
+async def _query(container, statement, **values):
+    items = container.query_items(
+        query=statement.text, parameters=statement.bind(**values))
+    return [item async for item in items]
+
+
+async def _read_documents(container, ids):
+    # Same as the sync resolver: a point read for a lone id, otherwise one
+    # query for the batch.
+    if len(ids) == 1 and _state["partition_key_path"] == '/id':
+        try:
+            item = await container.read_item(item=ids[0], partition_key=ids[0])
+        except CosmosResourceNotFoundError:
+            return {}
+        return {item['id']: Tweet.from_doc(item)}
+
+    items = await _query(container, queries.TWEETS_BY_IDS, ids=ids)
+    return {item['id']: Tweet.from_doc(item) for item in items}
+
+
+class _Loader:
+    # Every thread on the page walks on its own; the ids they ask for in
+    # the same turn of the loop go out together as IN queries of up to
+    # BATCH_SIZE ids, at most `concurrency` of them in flight. An ancestor
+    # shared between threads is asked for once.
+    def __init__(self, container, concurrency):
+        self._container = container
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._futures = {}
+        self._pending = []
+        self.stale = set()
+
+    def load(self, tweet_id):
+        future = self._futures.get(tweet_id)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._futures[tweet_id] = loop.create_future()
+        fresh, stale, _ = tweet_cache.shared.lookup([tweet_id])
+        if tweet_id in stale:
+            self.stale.add(tweet_id)
+        tweet = fresh.get(tweet_id) or stale.get(tweet_id)
+        if tweet is not None:
+            future.set_result(tweet)
+        else:
+            if not self._pending:
+                loop.call_soon(self._flush)
+            self._pending.append(tweet_id)
+        return future
+
+    async def load_conversation(self, conversation_id):
+        # The whole conversation up to the limit, so most walks never
+        # leave the cache.
+        async with self._semaphore:
+            items = await _query(
+                self._container, queries.CONVERSATION,
+                conversation_id=conversation_id,
+                limit=thread_resolver.CONVERSATION_LIMIT)
+        tweet_cache.shared.put_many(models.from_docs(items))
+
+    def _flush(self):
+        ids, self._pending = self._pending, []
+        for start in range(0, len(ids), BATCH_SIZE):
+            asyncio.ensure_future(self._fetch(ids[start:start + BATCH_SIZE]))
+
+    async def _fetch(self, ids):
+        try:
+            async with self._semaphore:
+                found = await _read_documents(self._container, ids)
+        except Exception as e:
+            for tweet_id in ids:
+                self._futures[tweet_id].set_exception(e)
+            return
+        tweet_cache.shared.put_many(found.values())
+        for tweet_id in ids:
+            self._futures[tweet_id].set_result(found.get(tweet_id))
+
+    async def refresh_metrics(self):
+        ids = sorted(self.stale)
+        batches = [ids[start:start + BATCH_SIZE]
+                   for start in range(0, len(ids), BATCH_SIZE)]
+
+        async def refresh(batch):
+            async with self._semaphore:
+                return await _query(self._container, queries.METRICS_BY_IDS, ids=batch)
+        updated = {}
+        for items in await asyncio.gather(*(refresh(batch) for batch in batches)):
+            updated.update(tweet_cache.shared.update_metrics(
+                {item['id']: item.get('public_metrics', {}) for item in items}))
+        return updated
+
+
+async def _resolve(settings, tweets, concurrency, responses):
+    _responses.set(responses)
+    container = await _get_container(settings)
+
+    loader = _Loader(container, concurrency)
+    await asyncio.gather(*(
+        loader.load_conversation(conversation_id) for conversation_id in
+        sorted(thread_resolver.conversations_to_load(tweets))))
+
+    known = {tweet.id: tweet for tweet in tweets}
+
+    async def walk(tweet):
+        seen = {tweet.id}
+        current = tweet.parent_id
+        while current is not None and current not in seen:
+            seen.add(current)
+            parent = known.get(current) or await loader.load(current)
+            if parent is None:
+                break
+            known[current] = parent
+            current = parent.parent_id
+
+    await asyncio.gather(*(walk(tweet) for tweet in tweets))
+    known.update(await loader.refresh_metrics())
+    return [build_thread(tweet, known) for tweet in tweets]
+
+
+def resolve_threads(settings, container, tweets, concurrency=DEFAULT_CONCURRENCY):
+    tweet_cache.shared.put_many(tweets)
+    responses = []
+    future = asyncio.run_coroutine_threadsafe(
+        _resolve(settings, tweets, concurrency, responses), _get_loop())
+    try:
+        return future.result(TIMEOUT_SECONDS)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        logger.warning(f"Async thread resolution took over {TIMEOUT_SECONDS}s, "
+                       f"falling back to the sync client")
+    finally:
+        for headers, size in list(responses):
+            cosmos_pool.record_response(headers, size)
+    # Whatever the async walk cached before it gave up saves a round trip here.
+    return thread_resolver.resolve_threads(container, tweets)
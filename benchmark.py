@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from datetime import date
+
+import cosmos_pool
+import fake_cosmos
+import synthetic_tweets
+
+VIEWS = ("Last 10 Elon Tweets", "All Tweet Threads", "Tweets by Date",
+         "Tweet Frequency")
+DEFAULT_SIZES = "1000,10000,100000"
+APPS = ("app.py", "app2.py", "app4.py")
+# Modules that should only load once a view needs them.
+HEAVY_MODULES = ("pandas", "plotly.express", "pyarrow", "aiohttp")
+IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+__import__(sys.argv[1])
+print(json.dumps({"ms": (time.perf_counter() - started) * 1000,
+                  "modules": len(sys.modules),
+                  "heavy": [m for m in sys.argv[2:] if m in sys.modules]}))
+"""
+
+
+def _percentile(values, percent):
+    # Nearest rank, so p95 of a handful of runs is an observed run.
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[int(rank) - 1]
+
+
+def _peak_rss_kb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS.
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def corpus_path(work_dir, size, corpus):
+    key = json.dumps(dict(corpus, tweets=size), sort_keys=True)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(work_dir, f"tweets-{size}-{digest}.sqlite")
+
+
+def build_corpus(path, size, corpus):
+    # Built once per size and generator settings, then reused across runs.
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.unlink(tmp_path)
+    container = fake_cosmos.open_container(tmp_path)
+    started = time.perf_counter()
+    container.load(synthetic_tweets.generate(size, **corpus))
+    container.close()
+    os.replace(tmp_path, path)
+    print(f"Built {size} tweet corpus in {time.perf_counter() - started:.1f}s: {path}",
+          file=sys.stderr)
+
+
+def measure_import(app, runs):
+    # A fresh interpreter per run, so nothing is already imported: this is
+    # what every new server process pays before the first session.
+    root = os.path.dirname(os.path.abspath(__file__))
+    module = os.path.splitext(app)[0]
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", IMPORT_PROBE, module, *HEAVY_MODULES],
+            capture_output=True, text=True, cwd=root)
+        if result.returncode != 0:
+            return {"view": "(import)", "app": app,
+                    "errors": [result.stderr.strip()[-2000:]]}
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+    timings = [sample["ms"] for sample in samples]
+    return {
+        "view": "(import)",
+        "app": app,
+        "runs": runs,
+        "import_ms_p50": round(_percentile(timings, 50), 2),
+        "import_ms_max": round(max(timings), 2),
+        "modules": samples[-1]["modules"],
+        "heavy_modules": samples[-1]["heavy"],
+        "errors": [],
+    }
+
+
+def run_view(app, db_path, view, runs, latency_ms, timeout):
+    # Runs in its own process so peak RSS belongs to this view alone.
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import single_flight
+    import tweet_cache
+
+    settings = {
+        "COSMOS_DB_BACKEND": cosmos_pool.SQLITE_BACKEND,
+        "COSMOS_DB_SQLITE_PATH": db_path,
+        "COSMOS_DB_SIMULATE_RU": "true",
+        "COSMOS_DB_LATENCY_MS": latency_ms,
+    }
+    # Same settings, same pooled container as the app's, so its counters
+    # see every request the view makes.
+    container = cosmos_pool.get_container(settings)
+    newest = next(iter(container.query_items(
+        "SELECT TOP 1 VALUE c.created_at FROM c "
+        "WHERE c.author.username = 'elonmusk' ORDER BY c.created_at DESC")), None)
+
+    at = AppTest.from_file(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), app),
+        default_timeout=timeout)
+    at.secrets["cosmosdb"] = settings
+    at.run()
+    at.sidebar.radio[0].set_value(view).run()
+    if view == "Tweets by Date" and newest:
+        at.sidebar.date_input[0].set_value(date.fromisoformat(newest[:10]))
+
+    # Start the measured runs from cold caches, whichever view the first
+    # run happened to render.
+    st.cache_data.clear()
+    tweet_cache.shared.clear()
+    single_flight.shared.clear()
+    container.reset_stats()
+
+    timings = []
+    errors = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        at.run()
+        timings.append((time.perf_counter() - started) * 1000)
+        errors.extend(str(e.value) for e in at.exception)
+
+    stats = container.stats()
+    warm = timings[1:] or timings
+    return {
+        "view": view,
+        "runs": runs,
+        "first_run_ms": round(timings[0], 2),
+        "p50_ms": round(_percentile(warm, 50), 2),
+        "p95_ms": round(_percentile(warm, 95), 2),
+        "queries": stats["requests"],
+        "rows": stats["rows"],
+        "bytes": stats["bytes"],
+        "request_charge": round(stats["request_charge"], 2),
+        "peak_rss_kb": _peak_rss_kb(),
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark each view against synthetic corpora. "
+                    "Writes one JSON line per app for import time, then "
+                    "one per size and view.")
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="comma-separated corpus sizes, e.g. 1000,10000000")
+    parser.add_argument("--views", default=",".join(VIEWS))
+    parser.add_argument("--runs", type=int, default=10,
+                        help="reruns per view; the first starts from cold caches")
+    parser.add_argument("--import-runs", type=int, default=5,
+                        help="fresh interpreters per app for import time; 0 skips it")
+    parser.add_argument("--latency-ms", type=float, default=0)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--work-dir", default=".bench")
+    parser.add_argument("--output", help="append results here instead of stdout")
+    parser.add_argument("--authors", type=int, default=50)
+    parser.add_argument("--elon-share", type=float, default=0.3)
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--reply-ratio", type=float, default=0.6)
+    parser.add_argument("--media-ratio", type=float, default=0.2)
+    parser.add_argument("--video-ratio", type=float, default=0.25)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker", nargs=2, metavar=("DB", "VIEW"),
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        db_path, view = args.worker
+        print(json.dumps(run_view(args.app, db_path, view, args.runs,
+                                  args.latency_ms, args.timeout)))
+        return
+
+    corpus = {
+        "authors": args.authors, "elon_share": args.elon_share,
+        "max_depth": args.max_depth, "reply_ratio": args.reply_ratio,
+        "media_ratio": args.media_ratio, "video_ratio": args.video_ratio,
+        "days": args.days, "seed": args.seed,
+    }
+    common = {
+        "commit": _commit(),
+        "app": args.app,
+        "python": platform.python_version(),
+        "latency_ms": args.latency_ms,
+        "corpus": corpus,
+    }
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        if args.import_runs:
+            for app in APPS:
+                record = measure_import(app, args.import_runs)
+                record.update({key: value for key, value in common.items()
+                               if key != "app"})
+                output.write(json.dumps(record, sort_keys=True) + "\n")
+                output.flush()
+        for size in (int(size) for size in args.sizes.split(",")):
+            db_path = corpus_path(args.work_dir, size, corpus)
+            build_corpus(db_path, size, corpus)
+            for view in args.views.split(","):
+                result = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__),
+                     "--app", args.app, "--runs", str(args.runs),
+                     "--latency-ms", str(args.latency_ms),
+                     "--timeout", str(args.timeout),
+                     "--worker", db_path, view],
+                    capture_output=True, text=True)
+                if result.returncode != 0:
+                    record = {"view": view, "errors": [result.stderr.strip()[-2000:]]}
+                else:
+                    record = json.loads(result.stdout.strip().splitlines()[-1])
+                record.update(common, tweets=size)
+                output.write(json.dumps(record, sort_keys=True) + "\n")
+                output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from azure.cosmos.exceptions import CosmosHttpResponseError
+
+import queries
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 5
+PAGE_SIZE = 1000
+# Tries per handler before a page is held back for the next poll.
+HANDLER_ATTEMPTS = 2
+RECENT_CAPACITY = 100
+GONE = 410
+
+
+def partition_key_ranges(container):
+    return list(container.client_connection._ReadPartitionKeyRanges(
+        container.container_link))
+
+
+class RecentTweets:
+    # The newest tweets (optionally for one author), kept sorted by
+    # created_at so the "latest N" views never need a query.
+    def __init__(self, capacity=RECENT_CAPACITY, username=None):
+        self.capacity = capacity
+        self.username = username
+        self._tweets = {}
+        self._ordered = []
+        self._lock = threading.Lock()
+
+    def apply(self, tweets):
+        with self._lock:
+            changed = False
+            for tweet in tweets:
+                if self.username is not None and \
+                        tweet.author.username != self.username:
+                    continue
+                self._tweets[tweet.id] = tweet
+                changed = True
+            if not changed:
+                return
+            ordered = sorted(self._tweets.values(),
+                             key=lambda tweet: tweet.created_at or 0,
+                             reverse=True)[:self.capacity]
+            self._tweets = {tweet.id: tweet for tweet in ordered}
+            self._ordered = ordered
+
+    def latest(self, limit):
+        with self._lock:
+            return self._ordered[:limit]
+
+    def __len__(self):
+        return len(self._ordered)
+
+
+recent_elon = RecentTweets(username='elonmusk')
+recent_all = RecentTweets()
+
+
+def seed_recent(container):
+    docs = list(queries.LATEST_TWEETS.query(container, limit=RECENT_CAPACITY))
+    docs.extend(queries.LATEST_BY_AUTHOR.query(
+        container, limit=RECENT_CAPACITY, username='elonmusk'))
+    return docs
+
+
+class ChangeFeedWorker:
+    def __init__(self, container, state_path, handlers, seed=None,
+                 poll_seconds=POLL_SECONDS, seed_handlers=None):
+        self.container = container
+        self.state_path = state_path
+        self.handlers = list(handlers)
+        self.seed = seed
+        # The seed is a projection, not whole documents; only handlers that
+        # can take those (the in-memory ones) get it.
+        self.seed_handlers = list(seed_handlers) if seed_handlers is not None \
+            else self.handlers
+        self.poll_seconds = poll_seconds
+        self.last_success = None
+        self.last_error = None
+        self.applied = 0
+        self._tokens = self._load_tokens()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _load_tokens(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f).get("continuations", {})
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning(
+                f"Ignoring unreadable change feed state in {self.state_path}")
+            return {}
+
+    def _save_tokens(self):
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"continuations": self._tokens}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def _dispatch(self, docs, handlers=None):
+        # Whether every handler took the page. Handlers are upserts, so
+        # the ones that did can safely be handed the same page again.
+        delivered = True
+        for handler in handlers if handlers is not None else self.handlers:
+            for _ in range(HANDLER_ATTEMPTS):
+                try:
+                    handler(docs)
+                    break
+                except Exception as e:
+                    logger.error(f"Change feed handler failed: {str(e)}")
+                    self.last_error = str(e)
+            else:
+                delivered = False
+        return delivered
+
+    def _read_page(self, range_id):
+        # One SDK page, and the etag its own response carried. The hook
+        # also fires when the feed is created, with the client's shared
+        # last_response_headers, which another request may have just set.
+        token = self._tokens.get(range_id)
+        responses = []
+
+        def capture(headers, _):
+            responses.append(headers)
+
+        feed = self.container.query_items_change_feed(
+            partition_key_range_id=range_id,
+            continuation=token,
+            max_item_count=PAGE_SIZE,
+            response_hook=capture)
+        responses.clear()
+        docs = list(next(feed.by_page(), []))
+        for headers in responses:
+            token = headers.get("etag") or token
+        return docs, token
+
+    def _refresh_ranges(self):
+        # A split replaces a range with its children; they carry on from
+        # the parent's continuation.
+        ranges = partition_key_ranges(self.container)
+        tokens = {}
+        for pk_range in ranges:
+            token = self._tokens.get(pk_range["id"])
+            for parent in pk_range.get("parents", []):
+                token = token or self._tokens.get(parent)
+            tokens[pk_range["id"]] = token
+        self._tokens = tokens
+
+    def poll_once(self):
+        if not self._tokens:
+            self._refresh_ranges()
+        changed = 0
+        held = False
+        for range_id in list(self._tokens):
+            while not self._stop.is_set():
+                try:
+                    docs, token = self._read_page(range_id)
+                except CosmosHttpResponseError as e:
+                    if e.status_code != GONE:
+                        raise
+                    logger.info(f"Partition key range {range_id} split, re-reading ranges")
+                    self._refresh_ranges()
+                    return changed + self.poll_once()
+                if docs and not self._dispatch(docs):
+                    # The token stays put, so the next poll reads this
+                    # page again rather than losing it.
+                    held = True
+                    break
+                self._tokens[range_id] = token
+                changed += len(docs)
+                if not docs:
+                    break
+        self._save_tokens()
+        self.applied += changed
+        self.last_success = time.time()
+        if not held:
+            self.last_error = None
+        return changed
+
+    def _run(self):
+        if self.seed is not None:
+            try:
+                self._dispatch(self.seed(self.container), self.seed_handlers)
+            except Exception as e:
+                logger.error(f"Change feed seed failed: {str(e)}")
+                self.last_error = str(e)
+        while not self._stop.is_set():
+            try:
+                changed = self.poll_once()
+                if changed:
+                    logger.info(f"Change feed applied {changed} changes")
+            except Exception as e:
+                logger.error(f"Change feed poll failed: {str(e)}")
+                self.last_error = str(e)
+            self._stop.wait(self.poll_seconds)
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def staleness(self):
+        if self.last_success is None:
+            return None
+        return time.time() - self.last_success
+
+    def is_fresh(self, max_staleness):
+        staleness = self.staleness
+        return staleness is not None and staleness <= max_staleness
+
+
+_worker = {"instance": None}
+_worker_lock = threading.Lock()
+
+
+def get_worker(container, state_path, handlers, seed=None,
+               poll_seconds=POLL_SECONDS, seed_handlers=None):
+    # One worker per process; a rebuilt pooled client is swapped in rather
+    # than starting a second consumer.
+    with _worker_lock:
+        worker = _worker["instance"]
+        if worker is None:
+            worker = ChangeFeedWorker(container, state_path, handlers,
+                                      seed=seed, poll_seconds=poll_seconds,
+                                      seed_handlers=seed_handlers)
+            worker.start()
+            _worker["instance"] = worker
+        elif worker.container is not container:
+            worker.container = container
+        return worker
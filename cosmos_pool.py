@@ -0,0 +1,209 @@
+import base64
+import hashlib
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from azure.core.pipeline.transport import RequestsTransport
+from azure.cosmos import CosmosClient
+from azure.cosmos.documents import ConnectionPolicy, RetryOptions
+
+import fake_cosmos
+import queries
+import telemetry
+import throttle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 32
+# 429s are retried by throttle, which honours retry-after-ms for every
+# session at once; the SDK's own retries would hold a session's request
+# back on top of that.
+DEFAULT_SDK_THROTTLE_RETRIES = 0
+
+# COSMOS_DB_BACKEND = "sqlite" swaps the account for fake_cosmos. These can
+# come from the [cosmosdb] secrets or, taking precedence, the environment.
+SQLITE_BACKEND = "sqlite"
+LOCAL_SETTINGS = (
+    "COSMOS_DB_BACKEND",
+    "COSMOS_DB_SQLITE_PATH",
+    "COSMOS_DB_FIXTURES",
+    "COSMOS_DB_SIMULATE_RU",
+    "COSMOS_DB_LATENCY_MS",
+    "COSMOS_DB_THROUGHPUT_RU",
+)
+
+# One client per process, shared by every Streamlit session and rerun.
+_lock = threading.Lock()
+_pool = {
+    "fingerprint": None,
+    "session": None,
+    "client": None,
+    "container": None,
+}
+
+
+class InvalidKeyError(ValueError):
+    pass
+
+
+def _setting(settings, name, default=None):
+    return os.environ.get(name, settings.get(name, default))
+
+
+def is_local(settings):
+    return str(_setting(settings, "COSMOS_DB_BACKEND", "")).lower() == SQLITE_BACKEND
+
+
+def fingerprint(settings):
+    if is_local(settings):
+        parts = [str(_setting(settings, name, "")) for name in LOCAL_SETTINGS]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+    parts = [
+        settings["COSMOS_DB_ENDPOINT"],
+        settings["COSMOS_DB_KEY"],
+        settings["COSMOS_DB_DATABASE_NAME"],
+        settings["COSMOS_DB_CONTAINER_NAME"],
+        str(settings.get("COSMOS_DB_POOL_SIZE", DEFAULT_POOL_SIZE)),
+        str(settings.get("COSMOS_DB_SDK_THROTTLE_RETRIES",
+                         DEFAULT_SDK_THROTTLE_RETRIES)),
+    ]
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def pool_size(settings):
+    return int(settings.get("COSMOS_DB_POOL_SIZE", DEFAULT_POOL_SIZE))
+
+
+def connection_policy(settings):
+    policy = ConnectionPolicy()
+    policy.RetryOptions = RetryOptions(
+        max_retry_attempt_count=int(settings.get(
+            "COSMOS_DB_SDK_THROTTLE_RETRIES", DEFAULT_SDK_THROTTLE_RETRIES)))
+    return policy
+
+
+def _create_session(size):
+    # Same adapter setup as azure-core's RequestsTransport, with a larger pool
+    # so concurrent sessions don't queue on urllib3's default of 10.
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=size,
+        pool_maxsize=size,
+        max_retries=Retry(total=False, redirect=False, raise_on_status=False))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def record_response(headers, size):
+    telemetry.record_response(headers, size)
+    throttle.shared.record_response(headers, size)
+
+
+def record_pipeline_response(response):
+    telemetry.record_pipeline_response(response)
+    throttle.shared.record_pipeline_response(response)
+
+
+def _build_local(settings):
+    path = _setting(settings, "COSMOS_DB_SQLITE_PATH", ":memory:")
+    simulate_ru = str(_setting(settings, "COSMOS_DB_SIMULATE_RU", "")).lower() \
+        in ("1", "true", "yes")
+    container = fake_cosmos.open_container(
+        path,
+        fixtures=_setting(settings, "COSMOS_DB_FIXTURES"),
+        simulate_ru=simulate_ru,
+        latency_ms=float(_setting(settings, "COSMOS_DB_LATENCY_MS", 0)),
+        throughput_ru=float(_setting(settings, "COSMOS_DB_THROUGHPUT_RU", 0)) or None,
+        on_response=record_response)
+    logger.info(f"Using local SQLite container at {path}")
+    return None, container, container
+
+
+def _build(settings):
+    if is_local(settings):
+        return _build_local(settings)
+
+    endpoint = settings["COSMOS_DB_ENDPOINT"]
+    key = settings["COSMOS_DB_KEY"]
+    database_name = settings["COSMOS_DB_DATABASE_NAME"]
+    container_name = settings["COSMOS_DB_CONTAINER_NAME"]
+    size = pool_size(settings)
+
+    logger.info(f"Length of Cosmos DB key: {len(key)}")
+
+    try:
+        base64.b64decode(key, validate=True)
+    except base64.binascii.Error:
+        raise InvalidKeyError(
+            "The Cosmos DB key is not a valid base64-encoded string.")
+
+    session = _create_session(size)
+    try:
+        transport = RequestsTransport(session=session, session_owner=False)
+        client = CosmosClient(
+            endpoint, key, transport=transport,
+            connection_policy=connection_policy(settings),
+            raw_response_hook=record_pipeline_response)
+        database = client.get_database_client(database_name)
+        container = database.get_container_client(container_name)
+        # Warm up: open the first pooled connection and load the container
+        # metadata while building, so the first query doesn't pay for them.
+        # The apps build the pool in their first rerun, the API at startup.
+        properties = container.read()
+        paths = properties.get('partitionKey', {}).get('paths', [])
+        queries.install_plan_cache(
+            client.client_connection, paths[0] if len(paths) == 1 else '')
+    except Exception:
+        session.close()
+        raise
+
+    logger.info(
+        f"Successfully initialized Cosmos DB client (pool size {size})")
+    return session, client, container
+
+
+def _close():
+    session = _pool["session"]
+    container = _pool["container"]
+    _pool.update(fingerprint=None, session=None, client=None, container=None)
+    if session is not None:
+        session.close()
+    elif isinstance(container, fake_cosmos.FakeContainer):
+        container.close()
+
+
+def get_container(settings):
+    key = fingerprint(settings)
+    with _lock:
+        if _pool["container"] is not None and _pool["fingerprint"] == key:
+            return _pool["container"]
+
+        if _pool["container"] is not None:
+            logger.info("Cosmos DB settings changed, rebuilding client")
+        _close()
+
+        session, client, container = _build(settings)
+        _pool.update(fingerprint=key, session=session,
+                     client=client, container=container)
+        return container
+
+
+def warm_up(settings):
+    # Build the pool before anything asks for it. A failure is only logged;
+    # the first request tries again and reports it.
+    try:
+        get_container(settings)
+    except Exception as e:
+        logger.warning(f"Cosmos DB warm-up failed: {str(e)}")
+
+
+def invalidate():
+    with _lock:
+        if _pool["container"] is not None:
+            logger.info("Discarding pooled Cosmos DB client")
+        _close()
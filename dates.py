@@ -0,0 +1,50 @@
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError, available_timezones
+
+DEFAULT_TIMEZONE = "UTC"
+# created_at as stored: UTC, fixed width, so strings compare as instants.
+CREATED_AT_FORMAT = "%Y-%m-%dT%H:%M:%S.000Z"
+
+_timezone_names = None
+
+
+def get_timezone(name=None):
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def timezone_names():
+    # Scans the tz database, so only once per process.
+    global _timezone_names
+    if _timezone_names is None:
+        _timezone_names = sorted(available_timezones())
+    return _timezone_names
+
+
+def to_created_at(moment):
+    return moment.astimezone(timezone.utc).strftime(CREATED_AT_FORMAT)
+
+
+def from_timestamp(seconds):
+    # An epoch time such as _ts, as a created_at string.
+    return to_created_at(datetime.fromtimestamp(seconds, timezone.utc))
+
+
+def day_range(day, tz):
+    # "2024-05-01" in tz -> half-open [start, end) on created_at. Both ends
+    # are local midnights, so a DST change day is 23 or 25 hours long.
+    local = date.fromisoformat(day)
+    start = datetime.combine(local, time(), tzinfo=tz)
+    end = datetime.combine(local + timedelta(days=1), time(), tzinfo=tz)
+    return to_created_at(start), to_created_at(end)
+
+
+def local_day(created_at, tz):
+    moment = datetime.strptime(created_at[:19], "%Y-%m-%dT%H:%M:%S")
+    return moment.replace(tzinfo=timezone.utc).astimezone(tz).date().isoformat()
+
+
+def today(tz):
+    return datetime.now(tz).date()
@@ -0,0 +1,236 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+import dates
+import queries
+
+logger = logging.getLogger(__name__)
+
+SYNC_PAGE_SIZE = 1000
+
+# Each tweet's local day is kept next to the per-day counters, so a
+# replayed tweet moves nothing and a changed one moves at most one count.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    day TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_day ON entries (username, day, created_at);
+CREATE TABLE IF NOT EXISTS days (
+    username TEXT NOT NULL,
+    day TEXT NOT NULL,
+    tweets INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (username, day)
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = (
+    "INSERT INTO days (username, day, tweets) VALUES (?, ?, ?) "
+    "ON CONFLICT (username, day) DO UPDATE SET tweets = tweets + excluded.tweets"
+)
+
+# On _ts, when Cosmos last wrote the tweet: a tweet ingested late has an
+# old created_at but a new _ts, so it still reaches the index.
+SYNC = queries.Statement(
+    "day_index", filters=["c._ts >= @watermark"],
+    order_by="c._ts ASC")
+
+
+class DayIndex:
+    # Tweet counts and ids per local day in one timezone. A different
+    # timezone buckets every tweet differently, so switching starts over.
+    def __init__(self, path, timezone_name):
+        self.path = path
+        self.last_refresh = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.executescript(SCHEMA)
+        self.use_timezone(timezone_name)
+
+    def _state(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key, value):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)",
+                (key, value))
+
+    def use_timezone(self, timezone_name):
+        self.tz = dates.get_timezone(timezone_name)
+        self.timezone_name = self.tz.key
+        with self._sync_lock:
+            if self._state("timezone") == self.timezone_name:
+                return
+            logger.info(f"Rebuilding the day index for {self.timezone_name}")
+            with self._lock:
+                self._db.executescript(
+                    "DELETE FROM entries; DELETE FROM days; DELETE FROM state;")
+            self._set_state("timezone", self.timezone_name)
+            self.last_refresh = 0.0
+
+    @property
+    def watermark(self):
+        # An index synced on created_at has only the old "watermark" key,
+        # and starts over.
+        watermark = self._state("ts_watermark")
+        return int(watermark) if watermark is not None else None
+
+    @property
+    def ready(self):
+        return self.watermark is not None
+
+    def covers(self, end):
+        # Every tweet written by the watermark is in, and a tweet can't be
+        # written before it was created, so days that ended by then are
+        # complete as of the last sync. Later ones may still be filling in.
+        watermark = self.watermark
+        return watermark is not None and dates.from_timestamp(watermark) >= end
+
+    def apply(self, docs):
+        latest = {}
+        for doc in docs:
+            if doc.get("id") and doc.get("created_at"):
+                latest[doc["id"]] = doc
+        if not latest:
+            return 0
+
+        deltas = defaultdict(int)
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                entries = []
+                for tweet_id, doc in latest.items():
+                    username = (doc.get("author") or {}).get("username") or ""
+                    day = dates.local_day(doc["created_at"], self.tz)
+                    previous = self._db.execute(
+                        "SELECT username, day FROM entries WHERE id = ?",
+                        (tweet_id,)).fetchone()
+                    if previous == (username, day):
+                        continue
+                    if previous is not None:
+                        deltas[previous] -= 1
+                    deltas[(username, day)] += 1
+                    entries.append((tweet_id, username, day, doc["created_at"]))
+
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", entries)
+                self._db.executemany(UPSERT, [
+                    (username, day, delta)
+                    for (username, day), delta in deltas.items() if delta])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(latest)
+
+    def sync(self, container):
+        # Same shape as the rollup sync: >= re-reads the boundary second's
+        # tweets, which apply() ignores.
+        with self._sync_lock:
+            watermark = self.watermark or 0
+            applied = 0
+            pages = SYNC.query(container, max_item_count=SYNC_PAGE_SIZE,
+                               watermark=watermark).by_page()
+            for page in pages:
+                docs = list(page)
+                if not docs:
+                    continue
+                applied += self.apply(docs)
+                watermark = max(watermark, docs[-1]["_ts"])
+                self._set_state("ts_watermark", watermark)
+            if not self.ready:
+                self._set_state("ts_watermark", watermark)
+            logger.info(f"Day index sync applied {applied} tweets")
+            return applied
+
+    def refresh_in_background(self, container, max_age):
+        with self._state_lock:
+            if self._refreshing or time.monotonic() - self.last_refresh < max_age:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.sync(container)
+            except Exception as e:
+                logger.error(f"Day index sync failed: {str(e)}")
+            finally:
+                self.last_refresh = time.monotonic()
+                self._refreshing = False
+
+        threading.Thread(target=run, name="day-index-sync", daemon=True).start()
+
+    def count(self, day, username):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT tweets FROM days WHERE username = ? AND day = ?",
+                (username, day)).fetchone()
+        return row[0] if row else 0
+
+    def counts(self, username):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT day, tweets FROM days "
+                "WHERE username = ? AND tweets > 0 ORDER BY day",
+                (username,)).fetchall()
+        return dict(rows)
+
+    def ids(self, day, username):
+        # Newest first, like the date query.
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id FROM entries WHERE username = ? AND day = ? "
+                "ORDER BY created_at DESC", (username, day)).fetchall()
+        return [row[0] for row in rows]
+
+    def neighbours(self, day, username):
+        # The nearest earlier and later days with tweets, or None.
+        with self._lock:
+            before = self._db.execute(
+                "SELECT MAX(day) FROM days "
+                "WHERE username = ? AND day < ? AND tweets > 0",
+                (username, day)).fetchone()[0]
+            after = self._db.execute(
+                "SELECT MIN(day) FROM days "
+                "WHERE username = ? AND day > ? AND tweets > 0",
+                (username, day)).fetchone()[0]
+        return before, after
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(path, timezone_name):
+    path = os.path.abspath(path)
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = DayIndex(path, timezone_name)
+        index = _indexes[path]
+    if index.timezone_name != dates.get_timezone(timezone_name).key:
+        index.use_timezone(timezone_name)
+    return index
@@ -0,0 +1,3 @@
+# Data, render and chart layers shared by app.py, app2.py and app4.py.
+# Charting pulls in pandas and plotly, so charts is only imported by the
+# views that draw one.
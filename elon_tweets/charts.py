@@ -0,0 +1,85 @@
+import streamlit as st
+
+import telemetry
+from elon_tweets import data, render
+
+FREQUENCY_GRAINS = {'Hourly': 'hour', 'Daily': 'day', 'Weekly': 'week',
+                    'Monthly': 'month', 'Hour of Week': 'hour_of_week'}
+MEASURES = {'Tweets': 'tweets', 'Likes': 'like_count',
+            'Retweets': 'retweet_count', 'Replies': 'reply_count',
+            'Quotes': 'quote_count', 'Bookmarks': 'bookmark_count',
+            'Impressions': 'impression_count'}
+WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+
+
+@telemetry.instrument("render")
+def display_frequency_chart(container, freq):
+    import pandas as pd
+    import plotly.express as px
+
+    daily_counts = data.get_daily_tweet_counts(container)
+    render.display_degraded_notice()
+    if not daily_counts:
+        st.info("No tweets to chart yet.")
+        return
+
+    # Cosmos returns one row per day; weeks and months are rolled up here.
+    df = pd.DataFrame(sorted(daily_counts.items()),
+                      columns=['created_at', 'count'])
+    df['created_at'] = pd.to_datetime(df['created_at'])
+
+    # Set the frequency for resampling
+    rule = {'Daily': 'D', 'Weekly': 'W', 'Monthly': 'M'}[freq]
+    df = df.set_index('created_at')['count'].resample(
+        rule).sum().reset_index(name='count')
+
+    fig = px.line(df, x='created_at', y='count',
+                  title=f'Elon Musk Tweet Frequency ({freq})')
+    st.plotly_chart(fig)
+
+
+@telemetry.instrument("render")
+def display_rollup_chart(store, freq, measure, average):
+    import pandas as pd
+    import plotly.express as px
+
+    # Already one row per bucket, so nothing is resampled here.
+    rows = data.get_rollup_series(
+        store, FREQUENCY_GRAINS[freq], MEASURES[measure], average)
+    if not rows:
+        st.info("No tweets to chart yet.")
+        return
+
+    label = f"{measure} per tweet" if average else measure
+    df = pd.DataFrame(rows, columns=['bucket', 'value'])
+    if freq == 'Hour of Week':
+        df['bucket'] = [f"{WEEKDAYS[int(bucket[0])]} {bucket[2:]}:00"
+                        for bucket in df['bucket']]
+        fig = px.bar(df, x='bucket', y='value',
+                     labels={'bucket': 'hour (UTC)', 'value': label},
+                     title=f'Elon Musk {label} by Hour of Week')
+    else:
+        if freq == 'Hourly':
+            df['bucket'] = df['bucket'] + ':00'
+        df['bucket'] = pd.to_datetime(df['bucket'])
+        fig = px.line(df, x='bucket', y='value',
+                      labels={'bucket': 'created_at', 'value': label},
+                      title=f'Elon Musk {label} ({freq})')
+    st.plotly_chart(fig)
+
+
+def display_frequency_view(container):
+    store = data.get_rollups(container)
+    if store is None:
+        freq_option = st.sidebar.radio(
+            "Select frequency:",
+            ("Daily", "Weekly", "Monthly")
+        )
+        display_frequency_chart(container, freq_option)
+    else:
+        freq_option = st.sidebar.radio(
+            "Select frequency:", tuple(FREQUENCY_GRAINS), index=1)
+        measure = st.sidebar.selectbox("Measure:", tuple(MEASURES))
+        average = measure != 'Tweets' and st.sidebar.checkbox(
+            "Average per tweet")
+        display_rollup_chart(store, freq_option, measure, average)
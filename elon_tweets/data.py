@@ -0,0 +1,379 @@
+import logging
+
+import streamlit as st
+
+import change_feed
+import cosmos_pool
+import dates
+import day_index
+import frequency
+import models
+import paging
+import prefetch
+import queries
+import rollups
+import single_flight
+import telemetry
+import throttle
+import tweet_cache
+from thread_resolver import resolve_threads
+
+logger = logging.getLogger(__name__)
+
+FEED_MAX_STALENESS_SECONDS = 120
+
+
+def get_snapshot():
+    settings = st.secrets.get("snapshot", {})
+    if not settings.get("PATH"):
+        return None
+    # pyarrow comes with the snapshot, as it does with the mirror.
+    import snapshot
+    return snapshot.open_snapshot(settings["PATH"])
+
+
+def is_snapshot(container):
+    return getattr(container, "is_snapshot", False)
+
+
+def initialize_cosmos_client():
+    # A configured snapshot stands in for the container in every view.
+    try:
+        local = get_snapshot()
+        if local is not None:
+            return local
+    except (OSError, ValueError) as e:
+        logger.error(f"Error opening the snapshot: {str(e)}")
+        st.error(
+            "The snapshot couldn't be opened. Please check the application logs.")
+        return None
+    try:
+        return cosmos_pool.get_container(st.secrets["cosmosdb"])
+    except cosmos_pool.InvalidKeyError as e:
+        logger.error(str(e))
+        st.error(
+            "There's an issue with the Cosmos DB key. Please check the application logs.")
+    except KeyError as e:
+        logger.error(f"Missing Cosmos DB configuration: {str(e)}")
+        st.error(
+            "Missing Cosmos DB configuration. Please check your Streamlit secrets.")
+    except Exception as e:
+        logger.error(f"Error initializing Cosmos DB client: {str(e)}")
+        st.error(
+            "An error occurred while connecting to Cosmos DB. Please check the application logs.")
+    return None
+
+
+def _mirror(path):
+    # pyarrow comes with the mirror, so only deployments that use it pay
+    # for the import.
+    import mirror
+    return mirror.get_mirror(path)
+
+
+def apply_live_changes(docs):
+    # Decode each changed document once for all in-memory consumers.
+    tweets = models.from_docs(docs)
+    tweet_cache.shared.refresh(tweets)
+    change_feed.recent_elon.apply(tweets)
+    change_feed.recent_all.apply(tweets)
+
+
+def get_change_feed(container):
+    settings = st.secrets.get("change_feed", {})
+    if not settings.get("ENABLED") or is_snapshot(container):
+        return None
+    handlers = [apply_live_changes]
+    mirror_settings = st.secrets.get("mirror", {})
+    if mirror_settings.get("PATH"):
+        handlers.append(_mirror(mirror_settings["PATH"]).apply)
+    rollup_settings = st.secrets.get("rollups", {})
+    if rollup_settings.get("PATH"):
+        handlers.append(rollups.get_store(rollup_settings["PATH"]).apply)
+    index_settings = st.secrets.get("day_index", {})
+    if index_settings.get("PATH"):
+        handlers.append(day_index.get_index(
+            index_settings["PATH"], display_timezone().key).apply)
+    return change_feed.get_worker(
+        container,
+        settings.get("STATE_PATH", ".change_feed_state.json"),
+        handlers,
+        seed=change_feed.seed_recent,
+        seed_handlers=[apply_live_changes],
+        poll_seconds=settings.get("POLL_SECONDS", change_feed.POLL_SECONDS))
+
+
+def get_live_tweets(container, recent, limit):
+    # Served from memory while the change feed is keeping up.
+    feed = get_change_feed(container)
+    if feed is None or not feed.is_fresh(FEED_MAX_STALENESS_SECONDS):
+        return None
+    if len(recent) < limit:
+        return None
+    return recent.latest(limit)
+
+
+def get_local_mirror(container):
+    settings = st.secrets.get("mirror", {})
+    if not settings.get("PATH") or is_snapshot(container):
+        return None
+    local = _mirror(settings["PATH"])
+    local.refresh_in_background(
+        container, max_age=settings.get("REFRESH_SECONDS", 60))
+    # Until the first full sync lands, keep serving straight from Cosmos.
+    return local if local.ready else None
+
+
+def get_rollups(container):
+    settings = st.secrets.get("rollups", {})
+    if not settings.get("PATH") or is_snapshot(container):
+        return None
+    store = rollups.get_store(settings["PATH"])
+    store.refresh_in_background(
+        container, max_age=settings.get("REFRESH_SECONDS", 60))
+    return store if store.ready else None
+
+
+def display_timezone():
+    # [dates] TIMEZONE = "America/Chicago"; the timezone a date picker
+    # starts in, and the one the day index buckets tweets by.
+    return dates.get_timezone(st.secrets.get("dates", {}).get("TIMEZONE"))
+
+
+def get_day_index(container):
+    settings = st.secrets.get("day_index", {})
+    if not settings.get("PATH") or is_snapshot(container):
+        return None
+    index = day_index.get_index(settings["PATH"], display_timezone().key)
+    index.refresh_in_background(
+        container, max_age=settings.get("REFRESH_SECONDS", 60))
+    return index if index.ready else None
+
+
+def _tweet_ids(tweets):
+    return tuple(tweet.id for tweet in tweets)
+
+
+@telemetry.instrument("query")
+@single_flight.coalesce("latest")
+@throttle.guarded(stale_ok=True)
+def get_last_10_tweets(container):
+    if is_snapshot(container):
+        return container.latest(10)
+    tweets = get_live_tweets(container, change_feed.recent_all, 10)
+    if tweets is not None:
+        return tweets
+    return models.from_docs(queries.LATEST_TWEETS.query(container, limit=10))
+
+
+@telemetry.instrument("query")
+@single_flight.coalesce("latest")
+@throttle.guarded(stale_ok=True)
+def get_elon_tweets(container, limit=10):
+    if is_snapshot(container):
+        return container.latest(limit, username='elonmusk')
+    tweets = get_live_tweets(container, change_feed.recent_elon, limit)
+    if tweets is not None:
+        return tweets
+    return models.from_docs(queries.LATEST_BY_AUTHOR.query(
+        container, limit=limit, username='elonmusk'))
+
+
+@telemetry.instrument("query")
+def get_tweets_on_date(container, date, tz=None):
+    tz = tz or display_timezone()
+    start, end = dates.day_range(date, tz)
+    if is_snapshot(container):
+        return paging.PagedList(
+            container.tweets_between(start, end, username='elonmusk'),
+            source="snapshot")
+    index = get_day_index(container)
+    ids = None
+    if index is not None and index.timezone_name == tz.key and index.covers(end):
+        ids = index.ids(date, 'elonmusk')
+        if not ids:
+            # Known to be empty: no query at all.
+            return paging.PagedList([])
+    local = get_local_mirror(container)
+    if local is not None:
+        return paging.PagedList(models.from_docs(
+            local.tweets_between(start, end, username='elonmusk')),
+            source="mirror")
+    if ids is not None:
+        # The day's tweets are known by id, so a page comes from the tweet
+        # cache and only what it lacks is read.
+        return paging.PagedList(ids, load=get_tweets_by_ids, source="day_index")
+    return queries.BY_AUTHOR_IN_RANGE.pages(
+        decode=models.Tweet.from_doc, start=start, end=end, username='elonmusk')
+
+
+def get_day_summary(container, date, tz=None):
+    # What the date picker can say without querying Cosmos: the day's
+    # tweet count and the nearest busy days, or None when nothing is known.
+    tz = tz or display_timezone()
+    if is_snapshot(container):
+        start, end = dates.day_range(date, tz)
+        count = len(container.tweets_between(start, end, username='elonmusk'))
+        return {"tweets": count, "complete": True, "before": None, "after": None}
+    index = get_day_index(container)
+    if index is None or index.timezone_name != tz.key:
+        return None
+    _, end = dates.day_range(date, index.tz)
+    before, after = index.neighbours(date, 'elonmusk')
+    return {"tweets": index.count(date, 'elonmusk'), "complete": index.covers(end),
+            "before": before, "after": after}
+
+
+@throttle.guarded()
+def get_tweets_by_ids(container, ids):
+    # In the order given. Cached tweets with stale metrics are read again
+    # along with the missing ones.
+    fresh, stale, missing = tweet_cache.shared.lookup(ids)
+    missing += list(stale)
+    if missing:
+        loaded = models.from_docs(queries.TWEETS_BY_IDS.query(container, ids=missing))
+        tweet_cache.shared.put_many(loaded)
+        fresh.update((tweet.id, tweet) for tweet in loaded)
+    return [fresh[tweet_id] for tweet_id in ids if tweet_id in fresh]
+
+
+@telemetry.instrument("query")
+@throttle.guarded()
+def get_tweet(container, tweet_id):
+    if is_snapshot(container):
+        return container.get(tweet_id)
+    docs = list(queries.TWEET_BY_ID.query(container, id=tweet_id))
+    return models.Tweet.from_doc(docs[0]) if docs else None
+
+
+@telemetry.instrument("query")
+@single_flight.coalesce("threads", key=_tweet_ids)
+def get_tweet_threads(container, tweets):
+    try:
+        return _resolve_threads(container, tweets)
+    except throttle.Throttled:
+        # Show each tweet on its own rather than fail the page.
+        throttle.mark_degraded()
+        return [[tweet] for tweet in tweets]
+
+
+@throttle.guarded(stale_ok=True, key=_tweet_ids)
+def _resolve_threads(container, tweets):
+    if is_snapshot(container):
+        return container.resolve_threads(tweets)
+    settings = st.secrets.get("threads", {})
+    if settings.get("ASYNC") and \
+            not cosmos_pool.is_local(st.secrets["cosmosdb"]):
+        # aiohttp and the async client load only when they're switched on.
+        import async_threads
+        if async_threads.available():
+            # Every thread on the page walked concurrently on the async
+            # client, with the ids they ask for batched together.
+            return async_threads.resolve_threads(
+                st.secrets["cosmosdb"], container, tweets,
+                concurrency=settings.get(
+                    "CONCURRENCY", async_threads.DEFAULT_CONCURRENCY))
+    return resolve_threads(container, tweets)
+
+
+@telemetry.instrument("query")
+@throttle.guarded()
+def get_session_pages(container, slot, signature, open_pages):
+    # Keep the loaded pages and continuation across reruns until the
+    # question (e.g. the selected date) changes.
+    state = st.session_state.get(slot)
+    if state is None or state[0] != signature:
+        pages = open_pages()
+        pages.adopt(*_load_page(container, slot, signature, pages))
+        state = (signature, pages)
+        st.session_state[slot] = state
+    return state[1]
+
+
+@telemetry.instrument("query")
+@throttle.guarded()
+def load_more_pages(container, slot, signature, pages):
+    if pages.done:
+        return []
+    page, continuation, done = _load_page(container, slot, signature, pages)
+    pages.adopt(page, continuation, done)
+    return page
+
+
+def _load_page(container, slot, signature, pages):
+    # The page after where `pages` stopped, read on a fork and shared
+    # through single flight: a prefetch of it still in flight is joined,
+    # a finished one is reused.
+    ahead = pages.fork()
+
+    def load():
+        page = ahead.load_more(container)
+        return page, ahead.continuation, ahead.done
+    return single_flight.shared.do(
+        _page_key(slot, signature, pages), load,
+        reuse_seconds=single_flight.reuse_seconds("pages"))
+
+
+def _page_key(slot, signature, pages):
+    # Where the page comes from is part of the question: the same day can
+    # be paged by a query, the mirror or the day index, and one's
+    # continuation means nothing to another.
+    return ("pages", slot, signature, pages.source, pages.continuation)
+
+
+def prefetch_session_pages(container, slot, signature, open_pages, owner):
+    # The first page of a question the reader is likely to ask next, and
+    # the threads on it.
+    if not prefetch.shared.enabled or is_snapshot(container):
+        return
+    # Opened on the session's thread; only the query runs in the pool.
+    pages = open_pages()
+
+    def steps():
+        page, _, _ = _load_page(container, slot, signature, pages)
+        yield
+        get_tweet_threads(container, page)
+    prefetch.shared.submit(_page_key(slot, signature, pages), steps, owner)
+
+
+def prefetch_next_page(container, slot, signature, pages, owner):
+    if not prefetch.shared.enabled or pages.done or is_snapshot(container):
+        return
+    # Forked now, on the session's thread; the session's copy moves on.
+    ahead = pages.fork()
+
+    def steps():
+        page, _, _ = _load_page(container, slot, signature, ahead)
+        yield
+        get_tweet_threads(container, page)
+    prefetch.shared.submit(_page_key(slot, signature, ahead), steps, owner)
+
+
+@telemetry.instrument("query")
+@single_flight.coalesce("details")
+@throttle.guarded()
+@st.cache_data(ttl=300, show_spinner=False)
+def get_tweet_details(_container, tweet_id):
+    if is_snapshot(_container):
+        return _container.details(tweet_id)
+    items = list(queries.TWEET_DETAILS.query(_container, id=tweet_id))
+    return items[0] if items else {}
+
+
+@telemetry.instrument("query")
+@single_flight.coalesce("counts")
+@throttle.guarded(expensive=True, stale_ok=True)
+def get_daily_tweet_counts(container):
+    if is_snapshot(container):
+        return container.daily_counts(username='elonmusk')
+    local = get_local_mirror(container)
+    if local is not None:
+        return local.daily_counts(username='elonmusk')
+    return frequency.get_daily_counts(container)
+
+
+@telemetry.instrument("query")
+@single_flight.coalesce("counts")
+def get_rollup_series(store, grain, field, average):
+    return store.series(grain, field=field, username='elonmusk',
+                        average=average)
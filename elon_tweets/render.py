@@ -0,0 +1,235 @@
+import logging
+from datetime import date, timedelta
+
+import streamlit as st
+from azure.core.exceptions import ServiceRequestError, ServiceResponseError
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+import cosmos_pool
+import dates
+import prefetch
+import single_flight
+import telemetry
+import throttle
+import tweet_html
+from elon_tweets import data
+
+logger = logging.getLogger(__name__)
+
+
+def start_page():
+    st.set_page_config(layout="wide")
+    st.markdown(tweet_html.STYLE_TAG, unsafe_allow_html=True)
+
+    container = data.initialize_cosmos_client()
+    if container is None:
+        st.error(
+            "Failed to initialize Cosmos DB client. The app cannot function without a database connection.")
+        return None
+
+    st.sidebar.title("Options")
+    if data.is_snapshot(container):
+        st.sidebar.caption(
+            f"Read-only snapshot of {len(container)} tweets, "
+            f"newest {container.manifest.get('newest') or 'n/a'}")
+    feed = data.get_change_feed(container)
+    if feed is not None:
+        display_feed_status(feed)
+    return container
+
+
+def display_feed_status(feed):
+    staleness = feed.staleness
+    if staleness is None:
+        st.sidebar.caption("Live updates: starting…")
+    elif staleness > data.FEED_MAX_STALENESS_SECONDS:
+        st.sidebar.warning(
+            f"Live updates stalled {staleness:.0f}s ago; reading from Cosmos DB.")
+    else:
+        st.sidebar.caption(f"Live updates: {staleness:.0f}s ago")
+
+
+@telemetry.instrument("render")
+def display_tweet_thread(container, thread, key):
+    # One payload per thread; the page's <style> is emitted once by start_page().
+    st.markdown(tweet_html.render_thread(thread), unsafe_allow_html=True)
+
+    with st.expander("Additional Tweet Information"):
+        # Details are fetched only once the reader asks for them.
+        for i, tweet in enumerate(thread):
+            label = f"Load details for @{tweet.author.username}'s tweet {tweet.id}"
+            if not st.checkbox(label, key=f"details-{key}-{i}"):
+                continue
+            details = data.get_tweet_details(container, tweet.id)
+            author = details.get('author', {})
+            st.json({
+                "id": details.get('id', ''),
+                "conversation_id": details.get('conversation_id', ''),
+                "lang": details.get('lang', ''),
+                "possibly_sensitive": details.get('possibly_sensitive', 'N/A'),
+                "reply_settings": details.get('reply_settings', 'N/A'),
+                "edit_controls": details.get('edit_controls', 'N/A'),
+                "author_info": {
+                    "id": author.get('id', ''),
+                    "created_at": author.get('created_at', ''),
+                    "description": author.get('description', 'N/A'),
+                    "location": author.get('location', 'Not specified'),
+                    "verified": author.get('verified', 'N/A'),
+                    "verified_type": author.get('verified_type', 'Not specified'),
+                    "public_metrics": author.get('public_metrics', {})
+                }
+            })
+
+
+def display_threads(container, tweets, label):
+    threads = data.get_tweet_threads(container, tweets)
+    display_degraded_notice()
+    for i, thread in enumerate(threads, 1):
+        st.subheader(f"{label} {i}")
+        display_tweet_thread(container, thread, f"thread-{i}")
+        st.markdown("---")
+
+
+def pick_timezone():
+    # Starts on the configured timezone; the choice lasts for the session.
+    default = data.display_timezone().key
+    names = dates.timezone_names()
+    if default not in names:
+        names = [default] + names
+    name = st.sidebar.selectbox(
+        "Timezone", names, index=names.index(default), key="timezone")
+    return dates.get_timezone(name)
+
+
+@telemetry.instrument("render")
+def pick_date(container, tz):
+    # Seeded once: a value that follows the timezone would give the widget
+    # a new identity, and the reader's date would be lost on every switch.
+    if "selected_date" not in st.session_state:
+        st.session_state["selected_date"] = dates.today(tz)
+    day = st.sidebar.date_input(
+        "Select a date", key="selected_date").strftime("%Y-%m-%d")
+    summary = data.get_day_summary(container, day, tz)
+    if summary is None:
+        st.sidebar.caption(f"Days run midnight to midnight {tz.key}.")
+    elif summary["tweets"]:
+        more = "" if summary["complete"] else " so far"
+        st.sidebar.caption(f"{summary['tweets']} tweets on {day}{more} ({tz.key}).")
+    else:
+        nearest = [f"{label} {other}" for label, other in
+                   (("before:", summary["before"]), ("after:", summary["after"]))
+                   if other]
+        note = f" Nearest busy days {', '.join(nearest)}." if nearest else ""
+        st.sidebar.caption(f"No tweets on {day} ({tz.key}).{note}")
+    return day
+
+
+def display_paged_threads(container, pages, label, slot, signature):
+    # Only tweets that are on screen get their threads resolved.
+    display_threads(container, pages.items, label)
+
+    if not pages.items:
+        st.info("No tweets found.")
+    elif not pages.done:
+        if st.button("Load more"):
+            data.load_more_pages(container, slot, signature, pages)
+            st.rerun()
+        data.prefetch_next_page(container, slot, signature, pages, _session_id())
+
+
+def display_tweets_by_date(container):
+    tz = pick_timezone()
+    day = pick_date(container, tz)
+    slot = "tweets_by_date"
+    # The same date is a different question in another timezone.
+
+    def open_pages(other):
+        return lambda: data.get_tweets_on_date(container, other, tz)
+    pages = data.get_session_pages(container, slot, (day, tz.key), open_pages(day))
+    display_paged_threads(container, pages, "Tweet", slot, (day, tz.key))
+
+    # Readers step through days one at a time.
+    for offset in (-1, 1):
+        other = (date.fromisoformat(day) + timedelta(days=offset)).isoformat()
+        data.prefetch_session_pages(
+            container, slot, (other, tz.key), open_pages(other), _session_id())
+
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+
+def display_degraded_notice():
+    if throttle.take_degraded():
+        st.caption(
+            "Cosmos DB is busy, so some of this comes from earlier results.")
+
+
+def configure_telemetry():
+    settings = st.secrets.get("telemetry", {})
+    telemetry.configure(jsonl_path=settings.get("JSONL_PATH"),
+                        prometheus_path=settings.get("PROMETHEUS_PATH"))
+    return bool(settings.get("DEBUG_PANEL")) or \
+        st.query_params.get("debug") == "1"
+
+
+def display_debug_panel():
+    run = telemetry.current_run()
+    with st.sidebar.expander("Debug: this rerun"):
+        st.caption(
+            f"{run.requests} Cosmos DB requests, {run.request_charge:.2f} RU, "
+            f"{run.items} items, {run.bytes / 1024:.1f} KB")
+        budget = throttle.shared.stats()
+        st.caption(
+            f"Throttling since start: {budget['throttled']} 429s, "
+            f"{budget['retries']} retries, {budget['waits']} waits "
+            f"({budget['waited_seconds']:.1f}s), {budget['shed']} shed, "
+            f"{budget['downgraded']} served stale, {budget['failed']} failed")
+        flights = single_flight.shared.stats()
+        st.caption(
+            f"Since start: {flights['executions']} queries run, "
+            f"{flights['coalesced']} shared in flight, "
+            f"{flights['reused']} answered from recent results")
+        ahead = prefetch.shared.stats()
+        st.caption(
+            f"Prefetch since start: {ahead['completed']} done, "
+            f"{ahead['pending']} pending, {ahead['cancelled']} cancelled, "
+            f"{ahead['shed'] + ahead['expired'] + ahead['rejected']} skipped, "
+            f"{ahead['failed']} failed")
+        st.dataframe([
+            {"call": "· " * span.depth + span.name, "kind": span.kind,
+             "ms": round(span.seconds * 1000, 1), "requests": span.requests,
+             "RU": round(span.request_charge, 2), "items": span.items,
+             "bytes": span.bytes}
+            for span in telemetry.current_spans()
+        ], hide_index=True)
+
+
+def run(main):
+    # The body of each app's `if __name__ == "__main__"`.
+    single_flight.configure(st.secrets.get("single_flight", {}))
+    throttle.configure(st.secrets.get("throttle", {}))
+    prefetch.configure(st.secrets.get("prefetch", {}))
+    throttle.take_degraded()
+    show_debug_panel = configure_telemetry()
+    # A new rerun means the reader moved on; what was queued for the last
+    # one may no longer be wanted, and is submitted again if it is.
+    session_id = _session_id()
+    prefetch.shared.cancel(session_id)
+    with prefetch.shared.foreground(session_id), telemetry.rerun():
+        try:
+            main()
+        except throttle.Throttled as e:
+            logger.warning(f"Throttled: {str(e)}")
+            wait = f" in {max(1, round(e.retry_after))}s" if e.retry_after else " shortly"
+            st.warning(
+                f"Cosmos DB is at its throughput limit right now. Please try again{wait}.")
+        except (ServiceRequestError, ServiceResponseError) as e:
+            # Drop the pooled client so the next rerun reconnects.
+            logger.error(f"Lost connection to Cosmos DB: {str(e)}")
+            cosmos_pool.invalidate()
+            st.error(
+                "The connection to Cosmos DB was lost. Please refresh the page to reconnect.")
+        if show_debug_panel:
+            display_debug_panel()
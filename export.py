@@ -0,0 +1,379 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+from azure.cosmos import _base
+from azure.cosmos.exceptions import CosmosHttpResponseError
+
+import change_feed
+import cosmos_pool
+import projections
+import queries
+import throttle
+from models import METRIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("ndjson", "parquet")
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_FILE_DOCS = 100_000
+DEFAULT_PARALLELISM = 8
+CHECKPOINT_FILE = "_checkpoint.json"
+PROGRESS_SECONDS = 10
+
+
+def _atomic_json(path, value):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(value, f)
+    os.replace(tmp_path, path)
+
+
+def _range_query(fields, since, until):
+    # Half-open [since, until) on created_at, and only the asked-for fields,
+    # both done by the server so nothing else is read or charged.
+    filters = []
+    if since:
+        filters.append("c.created_at >= @since")
+    if until:
+        filters.append("c.created_at < @until")
+    statement = queries.Statement(
+        select=projections.select_clause(fields) if fields else "*",
+        filters=filters)
+    values = {name: value for name, value in (("since", since), ("until", until))
+              if value}
+    return {"query": statement.text, "parameters": statement.bind(**values)}
+
+
+def _parquet_schema():
+    import pyarrow as pa
+    return pa.schema(
+        [("id", pa.string()), ("created_at", pa.string()),
+         ("username", pa.string())] +
+        [(field, pa.int64()) for field in METRIC_FIELDS] +
+        [("doc", pa.string())])
+
+
+class _NdjsonFile:
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "w", encoding="utf-8")
+
+    def write(self, docs):
+        for doc in docs:
+            self._f.write(json.dumps(doc, ensure_ascii=False))
+            self._f.write("\n")
+
+    def close(self):
+        self._f.close()
+
+
+class _ParquetFile:
+    # One row group per page, so nothing bigger than a page is held. The
+    # columns the analyses filter on are lifted out; the rest stays JSON.
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self.path = path
+        self._pa = pa
+        self._schema = _parquet_schema()
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write(self, docs):
+        rows = []
+        for doc in docs:
+            public_metrics = doc.get("public_metrics") or {}
+            row = {"id": doc.get("id"), "created_at": doc.get("created_at"),
+                   "username": (doc.get("author") or {}).get("username"),
+                   "doc": json.dumps(doc, ensure_ascii=False)}
+            for field in METRIC_FIELDS:
+                row[field] = public_metrics.get(field)
+            rows.append(row)
+        self._writer.write_table(
+            self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+class Export:
+    def __init__(self, container, output_dir, file_format="ndjson",
+                 fields=None, since=None, until=None,
+                 page_size=DEFAULT_PAGE_SIZE, file_docs=DEFAULT_FILE_DOCS,
+                 keep_system=False):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown export format: {file_format}")
+        self.container = container
+        self.output_dir = output_dir
+        self.file_format = file_format
+        self.fields = fields
+        self.since = since
+        self.until = until
+        self.page_size = page_size
+        self.file_docs = file_docs
+        self.keep_system = keep_system
+        # A full dump streams the change feed; anything narrower is a
+        # filtered, projected query against each range.
+        self.query = _range_query(fields, since, until) \
+            if fields or since or until else None
+        self.checkpoint_path = os.path.join(output_dir, CHECKPOINT_FILE)
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self.read = 0
+        self.written = 0
+        self.files = 0
+        os.makedirs(output_dir, exist_ok=True)
+        self._checkpoint = self._load_checkpoint()
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            return {"query": self.query, "ranges": {}}
+        # Continuations only mean something to the read that made them.
+        if checkpoint.get("query") != self.query:
+            raise ValueError(
+                f"{self.output_dir} holds an export with different "
+                f"--fields/--since/--until; use another directory")
+        return checkpoint
+
+    def _save_range(self, range_id, state):
+        with self._lock:
+            self._checkpoint["ranges"][range_id] = state
+            _atomic_json(self.checkpoint_path, self._checkpoint)
+
+    def _start_state(self, pk_range):
+        # A range that split since the last run carries on from its
+        # parent's continuation, as the change feed worker does.
+        ranges = self._checkpoint["ranges"]
+        state = ranges.get(pk_range["id"])
+        if state is not None:
+            return state
+        for parent in pk_range.get("parents", []):
+            if parent in ranges:
+                return {"continuation": ranges[parent]["continuation"],
+                        "next_file": 0, "exported": 0, "done": False}
+        return {"continuation": None, "next_file": 0, "exported": 0,
+                "done": False}
+
+    def _shape(self, doc):
+        if self.fields or self.keep_system:
+            return doc
+        return {key: value for key, value in doc.items()
+                if not key.startswith("_")}
+
+    def _query_page(self, range_id, continuation):
+        # One page of the query, sent to this range alone, as the SDK's own
+        # cross-partition reader does; no continuation back means the range
+        # is done.
+        link = self.container.container_link
+        options = {"maxItemCount": self.page_size,
+                   "enableCrossPartitionQuery": True}
+        if continuation:
+            options["continuation"] = continuation
+
+        def read():
+            return self.container.client_connection.QueryFeed(
+                _base.GetPathFromLink(link, "docs"),
+                _base.GetResourceIdOrFullNameFromLink(link),
+                self.query, options, range_id)
+
+        docs, headers = throttle.shared.run(read)
+        token = headers.get("x-ms-continuation")
+        return docs, token, token is None
+
+    def _read_page(self, range_id, continuation):
+        if self.query is not None:
+            return self._query_page(range_id, continuation)
+        # Exactly one SDK page, and the etag its own response carried. The
+        # hook also fires when the feed is created, with the client's
+        # last_response_headers, which another range's reader may have set.
+        responses = []
+
+        def capture(headers, _):
+            responses.append(headers)
+
+        def read():
+            feed = self.container.query_items_change_feed(
+                partition_key_range_id=range_id,
+                is_start_from_beginning=continuation is None,
+                continuation=continuation,
+                max_item_count=self.page_size,
+                response_hook=capture)
+            responses.clear()
+            return list(next(feed.by_page(), []))
+
+        docs = throttle.shared.run(read)
+        token = continuation
+        for headers in responses:
+            token = headers.get("etag") or token
+        return docs, token, not docs
+
+    def _open_file(self, range_id, number):
+        name = f"range-{range_id}-{number:05d}.{self.file_format}"
+        path = os.path.join(self.output_dir, name)
+        tmp_path = os.path.join(self.output_dir, f".tmp-{name}")
+        writer = _ParquetFile(tmp_path) if self.file_format == "parquet" \
+            else _NdjsonFile(tmp_path)
+        return writer, path
+
+    def export_range(self, pk_range):
+        # Files only ever end on a page boundary, and the checkpoint moves
+        # when one is renamed into place: a resumed run re-reads from the
+        # last finished file and discards the partial one.
+        range_id = pk_range["id"]
+        state = self._start_state(pk_range)
+        if state.get("done"):
+            return state["exported"]
+        continuation = state["continuation"]
+        number = state["next_file"]
+        exported = state["exported"]
+        writer, path, in_file = None, None, 0
+        try:
+            while not self._stopping.is_set():
+                docs, next_continuation, last = self._read_page(range_id, continuation)
+                with self._lock:
+                    self.read += len(docs)
+                if last and not docs:
+                    break
+                kept = [self._shape(doc) for doc in docs]
+                if kept:
+                    if writer is None:
+                        writer, path = self._open_file(range_id, number)
+                    writer.write(kept)
+                    in_file += len(kept)
+                    with self._lock:
+                        self.written += len(kept)
+                continuation = next_continuation
+                if writer is not None and in_file >= self.file_docs:
+                    writer.close()
+                    os.replace(writer.path, path)
+                    writer, number, exported = None, number + 1, exported + in_file
+                    in_file = 0
+                    with self._lock:
+                        self.files += 1
+                    self._save_range(range_id, {
+                        "continuation": continuation, "next_file": number,
+                        "exported": exported, "done": False})
+                if last:
+                    break
+            finished = not self._stopping.is_set()
+            if writer is not None:
+                writer.close()
+                os.replace(writer.path, path)
+                writer, number, exported = None, number + 1, exported + in_file
+                with self._lock:
+                    self.files += 1
+            self._save_range(range_id, {
+                "continuation": continuation, "next_file": number,
+                "exported": exported, "done": finished})
+            return exported
+        finally:
+            if writer is not None:
+                writer.close()
+                os.unlink(writer.path)
+
+    def run(self, parallelism=DEFAULT_PARALLELISM, report=None):
+        ranges = change_feed.partition_key_ranges(self.container)
+        logger.info(f"Exporting {len(ranges)} partition key ranges to {self.output_dir}")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(ranges))),
+                                thread_name_prefix="export") as executor:
+            futures = [executor.submit(self.export_range, pk_range)
+                       for pk_range in ranges]
+            try:
+                while not all(future.done() for future in futures):
+                    time.sleep(0.2)
+                    if report is not None:
+                        report(self.progress(started))
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # Let the other ranges reach a page boundary and stop.
+                self._stopping.set()
+                raise
+        return self.progress(started)
+
+    def progress(self, started):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            return {
+                "read": self.read,
+                "written": self.written,
+                "files": self.files,
+                "seconds": round(elapsed, 2),
+                "docs_per_second": round(self.read / elapsed, 1) if elapsed else None,
+                "request_charge": round(throttle.shared.stats()["charged"], 2),
+            }
+
+
+def _throttled_reporter(every):
+    last = {"at": time.monotonic()}
+
+    def report(progress):
+        if time.monotonic() - last["at"] >= every:
+            last["at"] = time.monotonic()
+            print(f"{progress['read']} read, {progress['written']} written, "
+                  f"{progress['files']} files, {progress['docs_per_second']} docs/s",
+                  file=sys.stderr)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Stream the container to rotating NDJSON or Parquet "
+                    "files, one reader per partition key range. Re-running "
+                    "with the same output directory resumes. A full dump "
+                    "reads the change feed; --fields, --since and --until "
+                    "turn it into a query, so only matching documents and "
+                    "fields are read (and charged).")
+    parser.add_argument("output_dir")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--fields",
+                        help="comma-separated fields to export, dotted for nested "
+                             "ones, e.g. id,created_at,author.username")
+    parser.add_argument("--since",
+                        help="export created_at >= this, e.g. 2024-05-01")
+    parser.add_argument("--until",
+                        help="export created_at < this, e.g. 2024-06-01")
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE)
+    parser.add_argument("--file-docs", type=int, default=DEFAULT_FILE_DOCS,
+                        help="documents per file before rotating")
+    parser.add_argument("--parallelism", type=int, default=DEFAULT_PARALLELISM)
+    parser.add_argument("--ru-per-second", type=float,
+                        help="RU/s this export may use; unset means only 429s slow it")
+    parser.add_argument("--keep-system", action="store_true",
+                        help="keep _rid, _ts, _etag and the other system properties")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    throttle.shared.configure(ru_per_second=args.ru_per_second)
+    container = cosmos_pool.get_container(st.secrets["cosmosdb"])
+    export = Export(
+        container, args.output_dir, file_format=args.format,
+        fields=tuple(args.fields.split(",")) if args.fields else None,
+        since=args.since, until=args.until, page_size=args.page_size,
+        file_docs=args.file_docs, keep_system=args.keep_system)
+    try:
+        progress = export.run(args.parallelism,
+                              report=_throttled_reporter(PROGRESS_SECONDS))
+    except (CosmosHttpResponseError, throttle.Throttled) as e:
+        print(f"Export stopped: {str(e)}. Run again to resume.", file=sys.stderr)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        print("Export interrupted. Run again to resume.", file=sys.stderr)
+        sys.exit(130)
+    print(json.dumps(progress))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,807 @@
+import glob
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from azure.cosmos.exceptions import (
+    CosmosHttpResponseError, CosmosResourceExistsError,
+    CosmosResourceNotFoundError)
+
+logger = logging.getLogger(__name__)
+
+# A stand-in for a Cosmos container backed by SQLite, for running the apps
+# offline. It understands the SQL subset the apps send: TOP, VALUE, object
+# projections, WHERE with =/</>/AND/OR/NOT/IN, STARTSWITH, ARRAY_CONTAINS,
+# SUBSTRING, GROUP BY with COUNT/MIN/MAX/SUM/AVG, ORDER BY, OFFSET LIMIT and
+# paging through by_page() continuations.
+
+DEFAULT_PAGE_SIZE = 100
+PARTITION_KEY_PATH = "/id"
+
+# Rough request charges, close enough to compare one query shape against
+# another: every round trip pays the base, then per row and per KB returned.
+POINT_READ_RU = 1.0
+QUERY_BASE_RU = 2.3
+QUERY_ROW_RU = 0.05
+RESPONSE_KB_RU = 0.3
+WRITE_KB_RU = 5.5
+THROTTLED = 429
+
+# Top-level document fields that get their own indexed column.
+INDEXED_PATHS = {
+    ("id",): "id",
+    ("created_at",): "created_at",
+    ("author", "username"): "username",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    id TEXT PRIMARY KEY,
+    created_at TEXT,
+    username TEXT,
+    lsn INTEGER NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_created_at ON docs (created_at);
+CREATE INDEX IF NOT EXISTS docs_username_created_at ON docs (username, created_at);
+CREATE INDEX IF NOT EXISTS docs_lsn ON docs (lsn);
+CREATE INDEX IF NOT EXISTS docs_conversation_id
+    ON docs (json_extract(body, '$."conversation_id"'));
+"""
+
+FUNCTIONS = {
+    "LENGTH": "length", "LOWER": "lower", "UPPER": "upper",
+    "ABS": "abs", "ROUND": "round",
+    "COUNT": "count", "MIN": "min", "MAX": "max", "SUM": "sum", "AVG": "avg",
+}
+
+TOKEN = re.compile(r"""
+    \s*(?:
+      (?P<number>\d+(?:\.\d+)?)
+    | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+    | (?P<param>@\w+)
+    | (?P<name>[A-Za-z_]\w*)
+    | (?P<op><=|>=|!=|<>|\|\||[=<>(){}\[\],.:*])
+    )""", re.VERBOSE)
+
+KEYWORDS = {
+    "SELECT", "TOP", "VALUE", "FROM", "WHERE", "ORDER", "GROUP", "BY", "ASC",
+    "DESC", "AS", "AND", "OR", "NOT", "IN", "OFFSET", "LIMIT", "TRUE", "FALSE",
+    "NULL",
+}
+
+
+def _sql_string(text):
+    return "'" + text.replace("'", "''") + "'"
+
+
+def _bad_request(message):
+    return CosmosHttpResponseError(status_code=400, message=message)
+
+
+def _tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = TOKEN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise _bad_request(f"Syntax error near '{text[pos:pos + 20]}'")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "string":
+            value = json.loads('"' + value[1:-1].replace('"', '\\"')
+                               .replace("\\'", "'") + '"') \
+                if value[0] == "'" else json.loads(value)
+        elif kind == "number":
+            value = float(value) if "." in value else int(value)
+        elif kind == "name" and value.upper() in KEYWORDS:
+            kind, value = "keyword", value.upper()
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Compiler:
+    # Recursive descent over the tokens, emitting SQLite SQL with positional
+    # parameters. Document paths read from indexed columns where one exists,
+    # json_extract(body, ...) otherwise.
+    def __init__(self, text, parameters, partition_key=None):
+        self.tokens = _tokenize(text)
+        self.pos = 0
+        self.parameters = {p["name"]: p["value"] for p in parameters or []}
+        self.partition_key = partition_key
+        self.alias = None
+
+    def peek(self, kind=None, value=None, offset=0):
+        if self.pos + offset >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos + offset]
+        if kind is not None and token[0] != kind:
+            return None
+        if value is not None and token[1] != value:
+            return None
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek(kind, value)
+        if token is not None:
+            self.pos += 1
+        return token
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.peek()
+            raise _bad_request(
+                f"Syntax error: expected {value or kind}, found "
+                f"{found[1] if found else 'end of query'}")
+        return token
+
+    def compile(self):
+        self.expect("keyword", "SELECT")
+        top = None
+        if self.accept("keyword", "TOP"):
+            top = self.count()
+
+        # The select list refers to the FROM alias, so skip ahead to read it.
+        start = self.pos
+        depth = 0
+        while self.peek() is not None:
+            if self.peek("op") and self.peek()[1] in "({[":
+                depth += 1
+            elif self.peek("op") and self.peek()[1] in ")}]":
+                depth -= 1
+            elif depth == 0 and self.peek("keyword", "FROM"):
+                break
+            self.pos += 1
+        self.expect("keyword", "FROM")
+        source = self.expect("name")[1]
+        if self.accept("keyword", "AS"):
+            self.alias = self.expect("name")[1]
+        else:
+            alias = self.accept("name")
+            self.alias = alias[1] if alias else source
+        tail = self.pos
+
+        self.pos = start
+        if self.accept("op", "*"):
+            projection, params = "json(body)", []
+        elif self.accept("keyword", "VALUE"):
+            projection, params = self.expr()
+        else:
+            projection, params = self.select_list()
+        self.expect("keyword", "FROM")
+        self.pos = tail
+
+        sql = [f"SELECT json_array({projection}) FROM docs"]
+        filters = []
+        if self.partition_key is not None:
+            segments, key = self.partition_key
+            filters.append((f"{path_sql(segments)} = ?", [key]))
+        if self.accept("keyword", "WHERE"):
+            filters.append(self.expr())
+        if filters:
+            sql.append("WHERE " + " AND ".join(where for where, _ in filters))
+            params += [param for _, where_params in filters
+                       for param in where_params]
+        if self.accept("keyword", "GROUP"):
+            self.expect("keyword", "BY")
+            groups, group_params = self.expr_list()
+            sql.append(f"GROUP BY {groups}")
+            params += group_params
+        if self.accept("keyword", "ORDER"):
+            self.expect("keyword", "BY")
+            orders = []
+            while True:
+                order, order_params = self.expr()
+                direction = "ASC"
+                if self.accept("keyword", "DESC"):
+                    direction = "DESC"
+                else:
+                    self.accept("keyword", "ASC")
+                orders.append(f"{order} {direction}")
+                params += order_params
+                if not self.accept("op", ","):
+                    break
+            sql.append("ORDER BY " + ", ".join(orders))
+        offset = 0
+        if self.accept("keyword", "OFFSET"):
+            offset = self.count()
+            self.expect("keyword", "LIMIT")
+            limit = self.count()
+            top = limit if top is None else min(top, limit)
+        if self.peek() is not None:
+            raise _bad_request(f"Syntax error near '{self.peek()[1]}'")
+        return " ".join(sql), params, top, offset
+
+    def count(self):
+        # TOP, OFFSET and LIMIT take a literal or a parameter.
+        param = self.accept("param")
+        value = self.parameters.get(param[1]) if param else self.expect("number")[1]
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise _bad_request(f"Expected a non-negative integer, found {value}")
+        return value
+
+    def select_list(self):
+        members = []
+        params = []
+        index = 0
+        while True:
+            index += 1
+            start = self.pos
+            sql, item_params = self.expr()
+            if self.accept("keyword", "AS"):
+                name = self.expect("name")[1]
+            else:
+                name = self.path_name(start) or f"${index}"
+            members.append(f"{_sql_string(name)}, {sql}")
+            params += item_params
+            if not self.accept("op", ","):
+                break
+        return "json_object(" + ", ".join(members) + ")", params
+
+    def path_name(self, start):
+        # An unaliased c.a.b is returned under its last segment, "b".
+        tokens = self.tokens[start:self.pos]
+        if len(tokens) >= 3 and tokens[0] == ("name", self.alias) and \
+                tokens[-2] == ("op", ".") and tokens[-1][0] == "name":
+            return tokens[-1][1]
+        return None
+
+    def expr_list(self):
+        parts = []
+        params = []
+        while True:
+            sql, item_params = self.expr()
+            parts.append(sql)
+            params += item_params
+            if not self.accept("op", ","):
+                return ", ".join(parts), params
+
+    def expr(self):
+        left, params = self.and_expr()
+        while self.accept("keyword", "OR"):
+            right, right_params = self.and_expr()
+            left = f"({left} OR {right})"
+            params += right_params
+        return left, params
+
+    def and_expr(self):
+        left, params = self.not_expr()
+        while self.accept("keyword", "AND"):
+            right, right_params = self.not_expr()
+            left = f"({left} AND {right})"
+            params += right_params
+        return left, params
+
+    def not_expr(self):
+        if self.accept("keyword", "NOT"):
+            sql, params = self.not_expr()
+            return f"(NOT {sql})", params
+        return self.comparison()
+
+    def comparison(self):
+        left, params = self.concat()
+        if self.accept("keyword", "IN"):
+            self.expect("op", "(")
+            values, value_params = self.expr_list()
+            self.expect("op", ")")
+            return f"({left} IN ({values}))", params + value_params
+        for op in ("=", "!=", "<>", "<=", ">=", "<", ">"):
+            if self.accept("op", op):
+                right, right_params = self.concat()
+                return f"({left} {'!=' if op == '<>' else op} {right})", \
+                    params + right_params
+        return left, params
+
+    def concat(self):
+        left, params = self.primary()
+        while self.accept("op", "||"):
+            right, right_params = self.primary()
+            left = f"({left} || {right})"
+            params += right_params
+        return left, params
+
+    def primary(self):
+        token = self.peek()
+        if token is None:
+            raise _bad_request("Syntax error: unexpected end of query")
+        kind, value = token
+
+        if kind in ("number", "string"):
+            self.pos += 1
+            return "?", [value]
+        if kind == "param":
+            self.pos += 1
+            if value not in self.parameters:
+                raise _bad_request(f"Parameter {value} is not defined")
+            return self.bind(self.parameters[value])
+        if kind == "keyword" and value in ("TRUE", "FALSE", "NULL"):
+            self.pos += 1
+            return {"TRUE": "1", "FALSE": "0", "NULL": "NULL"}[value], []
+        if token == ("op", "("):
+            self.pos += 1
+            sql, params = self.expr()
+            self.expect("op", ")")
+            return sql, params
+        if token == ("op", "{"):
+            return self.object_literal()
+        if token == ("op", "["):
+            self.pos += 1
+            items, params = ([], [])
+            if not self.accept("op", "]"):
+                items, params = self.expr_list()
+                self.expect("op", "]")
+            return f"json_array({items})", params
+        if kind == "name" and value == self.alias:
+            return self.path()
+        if kind == "name" and self.peek("op", "(", offset=1):
+            return self.function()
+        raise _bad_request(f"Syntax error near '{value}'")
+
+    def bind(self, value):
+        if isinstance(value, (list, dict)):
+            return "json(?)", [json.dumps(value)]
+        return "?", [value]
+
+    def object_literal(self):
+        self.expect("op", "{")
+        members = []
+        params = []
+        if not self.accept("op", "}"):
+            while True:
+                key = self.accept("string") or self.expect("name")
+                self.expect("op", ":")
+                sql, item_params = self.expr()
+                members.append(f"{_sql_string(key[1])}, {sql}")
+                params += item_params
+                if not self.accept("op", ","):
+                    break
+            self.expect("op", "}")
+        return "json_object(" + ", ".join(members) + ")", params
+
+    def path(self):
+        self.expect("name", self.alias)
+        segments = []
+        while True:
+            if self.accept("op", "."):
+                segments.append(self.expect("name")[1])
+            elif self.accept("op", "["):
+                segments.append(self.expect("string")[1])
+                self.expect("op", "]")
+            else:
+                break
+        return path_sql(segments), []
+
+    def function(self):
+        name = self.expect("name")[1].upper()
+        self.expect("op", "(")
+        args = []
+        if not self.accept("op", ")"):
+            while True:
+                args.append(self.expr())
+                if not self.accept("op", ","):
+                    break
+            self.expect("op", ")")
+        params = [param for _, arg_params in args for param in arg_params]
+        sql = [arg for arg, _ in args]
+
+        if name == "STARTSWITH" and len(args) == 2:
+            # A range rather than substr() so an indexed column stays indexed.
+            subject, prefix = args
+            return (f"({subject[0]} >= {prefix[0]} AND "
+                    f"{subject[0]} < ({prefix[0]} || char(1114111)))",
+                    subject[1] + prefix[1] + subject[1] + prefix[1])
+        if name == "ENDSWITH" and len(args) == 2:
+            return f"(substr({sql[0]}, -length({sql[1]})) = {sql[1]})", \
+                args[0][1] + args[1][1] + args[1][1]
+        if name == "CONTAINS" and len(args) == 2:
+            return f"(instr({sql[0]}, {sql[1]}) > 0)", params
+        if name == "SUBSTRING" and len(args) == 3:
+            return f"substr({sql[0]}, ({sql[1]}) + 1, {sql[2]})", params
+        if name == "ARRAY_CONTAINS" and len(args) == 2:
+            return (f"({sql[1]} IN (SELECT value FROM json_each({sql[0]})))",
+                    args[1][1] + args[0][1])
+        if name == "ARRAY_LENGTH" and len(args) == 1:
+            return f"json_array_length({sql[0]})", params
+        if name == "IS_DEFINED" and len(args) == 1:
+            return f"({sql[0]} IS NOT NULL)", params
+        if name in FUNCTIONS:
+            return f"{FUNCTIONS[name]}({', '.join(sql)})", params
+        raise _bad_request(f"Function {name} is not supported")
+
+
+def path_sql(segments):
+    if not segments:
+        return "json(body)"
+    column = INDEXED_PATHS.get(tuple(segments))
+    if column is not None:
+        return column
+    json_path = "$" + "".join(f'."{segment}"' for segment in segments)
+    return f"json_extract(body, {_sql_string(json_path)})"
+
+
+def _strip_undefined(value):
+    # Cosmos leaves out properties that don't exist; json_object() gives
+    # them as null.
+    if isinstance(value, dict):
+        return {key: _strip_undefined(item) for key, item in value.items()
+                if item is not None}
+    return value
+
+
+class _Connection:
+    # What the app reaches for on container.client_connection.
+    def __init__(self, container):
+        self._container = container
+        self.last_response_headers = {}
+
+    def _ReadPartitionKeyRanges(self, collection_link, **kwargs):
+        return [{"id": "0", "minInclusive": "", "maxExclusive": "FF",
+                 "parents": []}]
+
+    def QueryFeed(self, path, collection_id, query, options,
+                  partition_key_range_id=None, **kwargs):
+        # One page of a query against one range; there is only range "0".
+        compiled = self._container._compile(query["query"], query.get("parameters"))
+        continuation = options.get("continuation")
+        offset = json.loads(continuation)["offset"] if continuation else 0
+        headers = {}
+
+        def capture(response_headers, _):
+            headers.update(response_headers)
+
+        rows, _ = self._container._query_page(
+            compiled, offset, options.get("maxItemCount") or DEFAULT_PAGE_SIZE,
+            capture)
+        self.last_response_headers = headers
+        return rows, headers
+
+
+class _QueryPages:
+    # Stands in for the SDK's page iterator: one round trip per page, and
+    # continuation_token says where the next page starts.
+    def __init__(self, container, query, page_size, continuation_token,
+                 response_hook):
+        self._container = container
+        self._query = query
+        self._page_size = page_size
+        self._offset = json.loads(continuation_token)["offset"] \
+            if continuation_token else 0
+        self._response_hook = response_hook
+        self._done = False
+        self.continuation_token = continuation_token
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        rows, self.continuation_token = self._container._query_page(
+            self._query, self._offset, self._page_size, self._response_hook)
+        if self.continuation_token is None:
+            self._done = True
+        else:
+            self._offset = json.loads(self.continuation_token)["offset"]
+        return iter(rows)
+
+
+class _QueryIterable:
+    def __init__(self, container, query, page_size, response_hook):
+        self._container = container
+        self._query = query
+        self._page_size = page_size
+        self._response_hook = response_hook
+
+    def by_page(self, continuation_token=None):
+        return _QueryPages(self._container, self._query, self._page_size,
+                           continuation_token, self._response_hook)
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class _ChangeFeed:
+    # Like the SDK's, nothing is read until the first page is asked for,
+    # and a page is one round trip.
+    def __init__(self, read):
+        self._read = read
+
+    def by_page(self, continuation_token=None):
+        yield iter(self._read())
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class FakeContainer:
+    def __init__(self, path=":memory:", container_id="tweets",
+                 database_id="elon", partition_key_path=PARTITION_KEY_PATH,
+                 simulate_ru=False, latency_ms=0, on_response=None,
+                 throughput_ru=None):
+        self.id = container_id
+        self.container_link = f"dbs/{database_id}/colls/{container_id}"
+        self.partition_key_path = partition_key_path
+        self.simulate_ru = simulate_ru
+        self.latency_ms = latency_ms
+        self.on_response = on_response
+        # With throughput_ru, charges drain a one-second bucket of that many
+        # RU and requests made while it is overdrawn get 429s, as an account
+        # provisioned at that RU/s would.
+        self.throughput_ru = throughput_ru
+        self._ru_balance = throughput_ru or 0.0
+        self._ru_refilled = time.monotonic()
+        self.client_connection = _Connection(self)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.executescript(SCHEMA)
+        self._lsn = self._db.execute(
+            "SELECT COALESCE(MAX(lsn), 0) FROM docs").fetchone()[0]
+        self._stats = {"requests": 0, "request_charge": 0.0,
+                       "rows": 0, "bytes": 0, "throttled": 0}
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(1) FROM docs").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.update(requests=0, request_charge=0.0, rows=0, bytes=0,
+                               throttled=0)
+
+    def _respond(self, charge, rows, size, **headers):
+        # Every simulated round trip goes through here: latency, request
+        # charge, and the headers the SDK would have left behind.
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        if self.throughput_ru:
+            self._spend(charge)
+        headers["x-ms-activity-id"] = str(uuid.uuid4())
+        if self.simulate_ru:
+            headers["x-ms-request-charge"] = f"{charge:.2f}"
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["request_charge"] += charge if self.simulate_ru else 0
+            self._stats["rows"] += rows
+            self._stats["bytes"] += size
+        self.client_connection.last_response_headers = headers
+        if self.on_response is not None:
+            self.on_response(headers, size)
+        return headers
+
+    def _spend(self, charge):
+        with self._lock:
+            now = time.monotonic()
+            self._ru_balance = min(
+                self.throughput_ru,
+                self._ru_balance + (now - self._ru_refilled) * self.throughput_ru)
+            self._ru_refilled = now
+            if self._ru_balance < 0:
+                self._stats["throttled"] += 1
+                retry_after_ms = int(-self._ru_balance / self.throughput_ru * 1000) + 1
+            else:
+                self._ru_balance -= charge
+                return
+        headers = {"x-ms-retry-after-ms": str(retry_after_ms),
+                   "x-ms-request-charge": "0.00"}
+        self.client_connection.last_response_headers = headers
+        if self.on_response is not None:
+            self.on_response(headers, 0)
+        error = CosmosHttpResponseError(
+            status_code=THROTTLED,
+            message="Request rate is large. More Request Units may be needed.")
+        error.headers = headers
+        raise error
+
+    def _compile(self, query, parameters, partition_key=None):
+        try:
+            return _Compiler(query, parameters, partition_key).compile()
+        except CosmosHttpResponseError:
+            raise
+        except (IndexError, TypeError, ValueError) as e:
+            raise _bad_request(f"Syntax error: {str(e)}")
+
+    def _query_page(self, query, offset, page_size, response_hook):
+        sql, params, top, top_offset = query
+        limit = page_size
+        if top is not None:
+            limit = min(limit, top - offset)
+        rows = []
+        if limit > 0:
+            with self._lock:
+                try:
+                    cursor = self._db.execute(
+                        f"{sql} LIMIT ? OFFSET ?",
+                        params + [limit + 1, top_offset + offset])
+                    raw = [row[0] for row in cursor.fetchall()]
+                except sqlite3.Error as e:
+                    raise _bad_request(str(e))
+            more = len(raw) > limit and (top is None or offset + limit < top)
+            raw = raw[:limit]
+            for text in raw:
+                item = json.loads(text)[0]
+                if item is not None:
+                    rows.append(_strip_undefined(item))
+        else:
+            raw = []
+            more = False
+        size = sum(len(text) for text in raw)
+        charge = QUERY_BASE_RU + QUERY_ROW_RU * len(raw) + \
+            RESPONSE_KB_RU * size / 1024
+        continuation = json.dumps({"offset": offset + len(raw)}) if more else None
+        headers = {"x-ms-item-count": str(len(rows))}
+        if continuation:
+            headers["x-ms-continuation"] = continuation
+        headers = self._respond(charge, len(rows), size, **headers)
+        if response_hook is not None:
+            response_hook(headers, rows)
+        return rows, continuation
+
+    def query_items(self, query, parameters=None, partition_key=None,
+                    enable_cross_partition_query=None, max_item_count=None,
+                    response_hook=None, **kwargs):
+        if partition_key is not None:
+            partition_key = (self.partition_key_path.strip("/").split("/"),
+                             partition_key)
+        compiled = self._compile(query, parameters, partition_key)
+        return _QueryIterable(self, compiled, max_item_count or DEFAULT_PAGE_SIZE,
+                              response_hook)
+
+    def read(self, **kwargs):
+        self._respond(POINT_READ_RU, 0, 0)
+        return {"id": self.id,
+                "partitionKey": {"paths": [self.partition_key_path],
+                                 "kind": "Hash"}}
+
+    def read_item(self, item, partition_key, **kwargs):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body FROM docs WHERE id = ?", (item,)).fetchone()
+        if row is None:
+            self._respond(POINT_READ_RU, 0, 0)
+            raise CosmosResourceNotFoundError(
+                status_code=404, message=f"Entity with the specified id does not exist: {item}")
+        size = len(row[0])
+        self._respond(POINT_READ_RU * max(1, size / 1024), 1, size)
+        return json.loads(row[0])
+
+    def _write(self, docs, replace=True):
+        statement = "INSERT OR REPLACE" if replace else "INSERT"
+        with self._lock:
+            rows = []
+            # _ts is the service's last-modified time, in whole seconds.
+            ts = int(time.time())
+            for doc in docs:
+                doc = dict(doc, _ts=ts)
+                self._lsn += 1
+                rows.append((doc["id"], doc.get("created_at"),
+                             (doc.get("author") or {}).get("username"),
+                             self._lsn, json.dumps(doc)))
+            try:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    f"{statement} INTO docs (id, created_at, username, lsn, body) "
+                    "VALUES (?, ?, ?, ?, ?)", rows)
+                self._db.execute("COMMIT")
+            except sqlite3.IntegrityError:
+                self._db.execute("ROLLBACK")
+                raise CosmosResourceExistsError(
+                    status_code=409, message="Entity with the specified id already exists")
+        return sum(len(row[4]) for row in rows)
+
+    def upsert_item(self, body, **kwargs):
+        size = self._write([body])
+        self._respond(WRITE_KB_RU * max(1, size / 1024), 1, size)
+        return body
+
+    def create_item(self, body, **kwargs):
+        size = self._write([body], replace=False)
+        self._respond(WRITE_KB_RU * max(1, size / 1024), 1, size)
+        return body
+
+    def delete_item(self, item, partition_key, **kwargs):
+        with self._lock:
+            deleted = self._db.execute(
+                "DELETE FROM docs WHERE id = ?", (item,)).rowcount
+        self._respond(WRITE_KB_RU, 0, 0)
+        if not deleted:
+            raise CosmosResourceNotFoundError(
+                status_code=404, message=f"Entity with the specified id does not exist: {item}")
+
+    def load(self, docs, batch_size=1000):
+        # Bulk load without the per-request simulation; fixtures only.
+        batch = []
+        count = 0
+        for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                self._write(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+            count += len(batch)
+        return count
+
+    def query_items_change_feed(self, partition_key_range_id=None,
+                                is_start_from_beginning=False,
+                                continuation=None, max_item_count=None,
+                                response_hook=None, **kwargs):
+        return _ChangeFeed(lambda: self._read_change_feed(
+            is_start_from_beginning, continuation, max_item_count,
+            response_hook))
+
+    def _read_change_feed(self, is_start_from_beginning, continuation,
+                          max_item_count, response_hook):
+        # One range ("0"); the continuation is the last LSN handed out,
+        # returned quoted in the etag header the way the service does.
+        if continuation:
+            since = int(str(continuation).strip('"'))
+        elif is_start_from_beginning:
+            since = 0
+        else:
+            with self._lock:
+                since = self._lsn
+        sql = "SELECT lsn, body FROM docs WHERE lsn > ? ORDER BY lsn"
+        params = [since]
+        if max_item_count:
+            sql += " LIMIT ?"
+            params.append(max_item_count)
+        with self._lock:
+            rows = self._db.execute(sql, params).fetchall()
+        last = rows[-1][0] if rows else since
+        docs = [json.loads(body) for _, body in rows]
+        size = sum(len(body) for _, body in rows)
+        headers = self._respond(
+            QUERY_BASE_RU + RESPONSE_KB_RU * size / 1024, len(docs), size,
+            etag=f'"{last}"')
+        if response_hook is not None:
+            response_hook(headers, docs)
+        return docs
+
+
+def read_ndjson(paths):
+    # Accepts a file, a directory of *.ndjson files, or a comma-separated
+    # list of either.
+    for path in str(paths).split(","):
+        path = path.strip()
+        if not path:
+            continue
+        files = sorted(glob.glob(os.path.join(path, "*.ndjson"))) \
+            if os.path.isdir(path) else [path]
+        for file_path in files:
+            with open(file_path, encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield json.loads(line)
+
+
+def open_container(path=":memory:", fixtures=None, simulate_ru=False,
+                   latency_ms=0, **kwargs):
+    container = FakeContainer(path, simulate_ru=simulate_ru,
+                              latency_ms=latency_ms, **kwargs)
+    # A store on disk keeps what it already has; fixtures only seed an
+    # empty one.
+    if fixtures and not container.count():
+        count = container.load(read_ndjson(fixtures))
+        logger.info(f"Loaded {count} fixture documents into {path}")
+    return container
@@ -0,0 +1,29 @@
+import logging
+from collections import Counter
+
+from azure.cosmos.exceptions import CosmosHttpResponseError
+
+import queries
+
+logger = logging.getLogger(__name__)
+
+_group_by = {"supported": True}
+
+
+def get_daily_counts(container):
+    if _group_by["supported"]:
+        try:
+            counts = Counter()
+            for row in queries.DAILY_COUNTS.query(container, username='elonmusk'):
+                counts[row['day']] += row['tweets']
+            return dict(counts)
+        except CosmosHttpResponseError as e:
+            if e.status_code != 400:
+                raise
+            logger.warning(
+                f"GROUP BY not supported for this query, counting projected days instead: {e.message}")
+            _group_by["supported"] = False
+
+    # Fallback when the gateway refuses a cross-partition GROUP BY: still a
+    # projection of a 10-character string per tweet instead of the document.
+    return dict(Counter(queries.DAY_VALUES.query(container, username='elonmusk')))
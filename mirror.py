@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import queries
+
+logger = logging.getLogger(__name__)
+
+# Everything the views render; the rest of the document stays in Cosmos.
+MIRRORED_FIELDS = (
+    "id", "created_at", "text", "conversation_id", "lang",
+    "possibly_sensitive", "reply_settings", "edit_controls",
+    "referenced_tweets", "media", "public_metrics", "author",
+)
+
+# The watermark is _ts, when Cosmos last wrote the tweet, not created_at:
+# a tweet ingested late has an old created_at but a new _ts. _ts is in
+# whole seconds, so >= re-reads the last second's writes, which are
+# upserted again.
+SYNC = queries.Statement(
+    select=", ".join(f"c.{field}" for field in MIRRORED_FIELDS + ("_ts",)),
+    filters=["c._ts >= @watermark"],
+    order_by="c._ts ASC")
+
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("created_at", pa.string()),
+    ("username", pa.string()),
+    ("doc", pa.string()),
+])
+
+WATERMARK_FILE = "_watermark.json"
+PARTITION_FILE = "tweets.parquet"
+
+
+def _atomic_write(path, write):
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Mirror:
+    def __init__(self, root):
+        self.root = root
+        self.last_refresh = 0.0
+        self._sync_lock = threading.Lock()
+        # apply() runs on the change feed thread as well as under sync();
+        # each day file is read, merged and rewritten under this lock.
+        self._write_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        os.makedirs(root, exist_ok=True)
+
+    @property
+    def watermark(self):
+        try:
+            with open(os.path.join(self.root, WATERMARK_FILE)) as f:
+                # A created_at watermark from before _ts isn't read, so the
+                # next sync starts over.
+                return json.load(f).get("ts")
+        except FileNotFoundError:
+            return None
+
+    @property
+    def ready(self):
+        return self.watermark is not None
+
+    def _partition_path(self, day):
+        return os.path.join(self.root, f"day={day}", PARTITION_FILE)
+
+    def days(self):
+        days = []
+        for name in os.listdir(self.root):
+            if name.startswith("day=") and os.path.exists(
+                    os.path.join(self.root, name, PARTITION_FILE)):
+                days.append(name[len("day="):])
+        return sorted(days)
+
+    def _read_partition(self, day, columns=None):
+        try:
+            return pq.read_table(self._partition_path(day), columns=columns)
+        except FileNotFoundError:
+            return pa.table({name: [] for name in (columns or SCHEMA.names)})
+
+    def _upsert_partition(self, day, docs):
+        rows = {row["id"]: row for row in self._read_partition(day).to_pylist()}
+        for doc in docs:
+            rows[doc["id"]] = {
+                "id": doc["id"],
+                "created_at": doc["created_at"],
+                "username": doc.get("author", {}).get("username"),
+                "doc": json.dumps(doc, separators=(",", ":")),
+            }
+        ordered = sorted(rows.values(), key=lambda row: row["created_at"],
+                         reverse=True)
+        table = pa.Table.from_pylist(ordered, schema=SCHEMA)
+
+        path = self._partition_path(day)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write(path, lambda tmp: pq.write_table(table, tmp))
+
+    def _set_watermark(self, watermark):
+        path = os.path.join(self.root, WATERMARK_FILE)
+
+        def write(tmp):
+            with open(tmp, "w") as f:
+                json.dump({"ts": watermark}, f)
+        _atomic_write(path, write)
+
+    def apply(self, docs):
+        # Change feed documents are whole, system properties included;
+        # only what the sync would have fetched is stored.
+        by_day = defaultdict(list)
+        for doc in docs:
+            by_day[doc["created_at"][:10]].append(
+                {field: doc[field] for field in MIRRORED_FIELDS if field in doc})
+        with self._write_lock:
+            for day, day_docs in by_day.items():
+                self._upsert_partition(day, day_docs)
+
+    def sync(self, container):
+        # Day files are written before the watermark moves, so a sync that
+        # dies halfway simply re-fetches and re-upserts the same tweets.
+        with self._sync_lock:
+            watermark = self.watermark or 0
+            docs = list(SYNC.query(container, watermark=watermark))
+            if docs:
+                self.apply(docs)
+                self._set_watermark(max(doc["_ts"] for doc in docs))
+            elif not self.ready:
+                self._set_watermark(watermark)
+            logger.info(f"Mirror sync applied {len(docs)} new or changed tweets")
+            return len(docs)
+
+    def refresh_in_background(self, container, max_age):
+        with self._state_lock:
+            if self._refreshing or time.monotonic() - self.last_refresh < max_age:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.sync(container)
+            except Exception as e:
+                logger.error(f"Mirror sync failed: {str(e)}")
+            finally:
+                self.last_refresh = time.monotonic()
+                self._refreshing = False
+
+        threading.Thread(target=run, name="mirror-sync", daemon=True).start()
+
+    def tweets_on_date(self, day, username=None):
+        table = self._read_partition(day, columns=["username", "doc"])
+        return [json.loads(row["doc"]) for row in table.to_pylist()
+                if username is None or row["username"] == username]
+
+    def tweets_between(self, start, end, username=None):
+        # Partitions are UTC days; a local day can straddle two of them.
+        first = date.fromisoformat(start[:10])
+        last = date.fromisoformat(end[:10])
+        tweets = []
+        for offset in range((last - first).days, -1, -1):
+            day = (first + timedelta(days=offset)).isoformat()
+            tweets.extend(doc for doc in self.tweets_on_date(day, username)
+                          if start <= doc["created_at"] < end)
+        return tweets
+
+    def daily_counts(self, username=None):
+        counts = {}
+        for day in self.days():
+            usernames = self._read_partition(
+                day, columns=["username"]).column("username").to_pylist()
+            count = sum(1 for name in usernames
+                        if username is None or name == username)
+            if count:
+                counts[day] = count
+        return counts
+
+
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def get_mirror(root):
+    root = os.path.abspath(root)
+    with _mirrors_lock:
+        if root not in _mirrors:
+            _mirrors[root] = Mirror(root)
+        return _mirrors[root]
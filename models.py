@@ -0,0 +1,145 @@
+import sys
+import threading
+import weakref
+from array import array
+from datetime import datetime, timezone
+
+METRIC_FIELDS = (
+    "retweet_count", "reply_count", "like_count", "quote_count",
+    "bookmark_count", "impression_count",
+)
+# Stored in the metrics array when the API didn't report a counter.
+MISSING = -1
+
+_authors = weakref.WeakValueDictionary()
+_authors_lock = threading.Lock()
+
+
+def parse_created_at(value):
+    # "2024-05-01T10:00:00.000Z" -> epoch milliseconds
+    moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def format_created_at(epoch_ms):
+    moment = datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc)
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.") + f"{epoch_ms % 1000:03d}Z"
+
+
+class Author:
+    __slots__ = ("id", "name", "username", "profile_image_url", "__weakref__")
+
+    def __init__(self, id, name, username, profile_image_url):
+        self.id = id
+        self.name = name
+        self.username = username
+        self.profile_image_url = profile_image_url
+
+    @classmethod
+    def intern(cls, doc):
+        # Every tweet by the same account shares one Author instance.
+        key = (doc.get('id'), doc.get('name'), doc.get('username'),
+               doc.get('profile_image_url'))
+        with _authors_lock:
+            author = _authors.get(key)
+            if author is None:
+                author = cls(*key)
+                _authors[key] = author
+            return author
+
+    def to_doc(self):
+        doc = {}
+        for field in ("id", "name", "username", "profile_image_url"):
+            value = getattr(self, field)
+            if value is not None:
+                doc[field] = value
+        return doc
+
+
+class Tweet:
+    __slots__ = ("id", "text", "created_at", "author", "parent_id",
+                 "conversation_id", "media", "metrics")
+
+    def __init__(self, id, text, created_at, author, parent_id=None,
+                 conversation_id=None, media=(), metrics=None):
+        self.id = id
+        self.text = text
+        self.created_at = created_at
+        self.author = author
+        self.parent_id = parent_id
+        self.conversation_id = conversation_id
+        self.media = media
+        self.metrics = metrics if metrics is not None else \
+            array('q', [MISSING] * len(METRIC_FIELDS))
+
+    @staticmethod
+    def _metrics_array(public_metrics):
+        return array('q', (public_metrics.get(field, MISSING)
+                           for field in METRIC_FIELDS))
+
+    @classmethod
+    def from_doc(cls, doc):
+        parent_id = None
+        for ref in doc.get('referenced_tweets') or []:
+            if ref['type'] == 'replied_to':
+                parent_id = ref['id']
+                break
+        media = tuple(
+            (item.get('type'), item.get('url'), item.get('preview_image_url'))
+            for item in doc.get('media') or [])
+        created_at = doc.get('created_at')
+        return cls(
+            id=doc['id'],
+            text=doc.get('text', ''),
+            created_at=parse_created_at(created_at) if created_at else None,
+            author=Author.intern(doc.get('author') or {}),
+            parent_id=parent_id,
+            conversation_id=doc.get('conversation_id'),
+            media=media,
+            metrics=cls._metrics_array(doc.get('public_metrics') or {}),
+        )
+
+    def with_metrics(self, public_metrics):
+        return Tweet(self.id, self.text, self.created_at, self.author,
+                     self.parent_id, self.conversation_id, self.media,
+                     self._metrics_array(public_metrics))
+
+    def metric(self, field):
+        value = self.metrics[METRIC_FIELDS.index(field)]
+        return None if value == MISSING else value
+
+    @property
+    def public_metrics(self):
+        return {field: value for field, value in zip(METRIC_FIELDS, self.metrics)
+                if value != MISSING}
+
+    @property
+    def created_at_iso(self):
+        return format_created_at(self.created_at) if self.created_at is not None else None
+
+    def approx_size(self):
+        return (sys.getsizeof(self) + sys.getsizeof(self.text) +
+                sys.getsizeof(self.metrics) +
+                sum(sys.getsizeof(item) for item in self.media))
+
+    def to_doc(self):
+        doc = {"id": self.id, "text": self.text, "author": self.author.to_doc(),
+               "public_metrics": self.public_metrics}
+        if self.created_at is not None:
+            doc["created_at"] = self.created_at_iso
+        if self.parent_id is not None:
+            doc["referenced_tweets"] = [{"type": "replied_to", "id": self.parent_id}]
+        if self.conversation_id is not None:
+            doc["conversation_id"] = self.conversation_id
+        if self.media:
+            doc["media"] = [
+                {key: value for key, value in
+                 zip(("type", "url", "preview_image_url"), item) if value is not None}
+                for item in self.media]
+        return doc
+
+
+def from_docs(docs):
+    return [Tweet.from_doc(doc) for doc in docs]
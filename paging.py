@@ -0,0 +1,100 @@
+PAGE_SIZE = 20
+
+
+class PagedQuery:
+    # Lives in st.session_state: the items loaded so far plus where to
+    # resume. The page iterator is reopened from the continuation token if
+    # the pooled client behind it has been rebuilt.
+    source = "query"
+
+    def __init__(self, query, parameters=None, page_size=PAGE_SIZE,
+                 decode=None):
+        self.query = query
+        self.parameters = parameters
+        self.page_size = page_size
+        self.decode = decode
+        self.items = []
+        self.continuation = None
+        self.done = False
+        self._container = None
+        self._pages = None
+
+    def _open(self, container):
+        self._container = container
+        self._pages = container.query_items(
+            query=self.query,
+            parameters=self.parameters,
+            enable_cross_partition_query=True,
+            max_item_count=self.page_size).by_page(self.continuation)
+
+    def load_more(self, container):
+        if self.done:
+            return []
+        if self._pages is None or container is not self._container:
+            self._open(container)
+        page = list(next(self._pages, []))
+        if not page:
+            self.done = True
+            return []
+        if self.decode is not None:
+            page = [self.decode(item) for item in page]
+        self.continuation = self._pages.continuation_token
+        # No continuation means that was the last page.
+        self.done = self.continuation is None
+        self.items.extend(page)
+        return page
+
+    def fork(self):
+        # Positioned where this one stopped, with nothing loaded, so a page
+        # can be read ahead without touching the session's copy.
+        ahead = PagedQuery(self.query, self.parameters,
+                           page_size=self.page_size, decode=self.decode)
+        ahead.continuation = self.continuation
+        ahead.done = self.done
+        return ahead
+
+    def adopt(self, page, continuation, done):
+        # Take a page a fork loaded.
+        self.items.extend(page)
+        self.continuation = continuation
+        self.done = done
+        # The open iterator, if any, is behind now.
+        self._pages = None
+
+
+class PagedList:
+    # Same interface over rows that are already local (e.g. the mirror),
+    # or over keys load(container, keys) turns into a page of items; the
+    # continuation is the offset of the next page. source tells pagers of
+    # the same question apart, as their continuations don't mix.
+    def __init__(self, rows, page_size=PAGE_SIZE, load=None, source="rows"):
+        self.rows = rows
+        self.page_size = page_size
+        self.load = load
+        self.source = source
+        self.items = []
+        self.continuation = None
+        self.done = not rows
+
+    def load_more(self, container=None):
+        start = int(self.continuation or 0)
+        end = min(start + self.page_size, len(self.rows))
+        page = self.rows[start:end]
+        if self.load is not None:
+            page = self.load(container, page)
+        self.items.extend(page)
+        self.continuation = str(end) if end < len(self.rows) else None
+        self.done = self.continuation is None
+        return page
+
+    def fork(self):
+        ahead = PagedList(self.rows, page_size=self.page_size,
+                          load=self.load, source=self.source)
+        ahead.continuation = self.continuation
+        ahead.done = self.done
+        return ahead
+
+    def adopt(self, page, continuation, done):
+        self.items.extend(page)
+        self.continuation = continuation
+        self.done = done
@@ -0,0 +1,160 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import throttle
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_PENDING = 8
+# How long a queued task waits for its session's script run before giving up.
+DEFAULT_IDLE_WAIT_SECONDS = 5.0
+
+
+class _Task:
+    __slots__ = ("key", "owner", "steps", "cancelled")
+
+    def __init__(self, key, owner, steps):
+        self.key = key
+        self.owner = owner
+        self.steps = steps
+        self.cancelled = False
+
+
+class Prefetcher:
+    # Loads what a reader is likely to ask for next on a small pool. The
+    # results go wherever the steps put them (single-flight results, the
+    # tweet cache), so foreground code finds them, or joins them while
+    # they're still in flight, without knowing they were prefetched.
+    # A task is a generator whose yields split it into steps; before each
+    # step it waits until the script run of the session that asked for it
+    # is over, so it never competes with that session's own queries, and
+    # it is shed like an expensive query when RU are short. Other
+    # sessions' runs don't hold it back: the RU budget is what they share.
+    def __init__(self, enabled=False, workers=DEFAULT_WORKERS,
+                 max_pending=DEFAULT_MAX_PENDING,
+                 idle_wait=DEFAULT_IDLE_WAIT_SECONDS, timer=time.monotonic):
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._timer = timer
+        self._foreground = {}
+        self._tasks = {}
+        self._executor = None
+        self.workers = None
+        self.configure(enabled, workers, max_pending, idle_wait)
+        self._stats = {"submitted": 0, "completed": 0, "rejected": 0,
+                       "cancelled": 0, "expired": 0, "shed": 0, "failed": 0}
+
+    def configure(self, enabled=False, workers=DEFAULT_WORKERS,
+                  max_pending=DEFAULT_MAX_PENDING,
+                  idle_wait=DEFAULT_IDLE_WAIT_SECONDS):
+        with self._lock:
+            self.enabled = bool(enabled)
+            self.max_pending = int(max_pending)
+            self.idle_wait = float(idle_wait)
+            if int(workers) != self.workers:
+                # Tasks already handed to the old pool still finish there.
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                self.workers = int(workers)
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="prefetch")
+
+    @contextmanager
+    def foreground(self, owner):
+        with self._lock:
+            self._foreground[owner] = self._foreground.get(owner, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._foreground[owner] -= 1
+                if not self._foreground[owner]:
+                    del self._foreground[owner]
+                    self._idle.notify_all()
+
+    def submit(self, key, steps, owner=None):
+        # steps() returns the generator; nothing in it runs until a worker
+        # and an idle moment are both free.
+        with self._lock:
+            if not self.enabled or key in self._tasks:
+                return False
+            if len(self._tasks) >= self.max_pending:
+                self._stats["rejected"] += 1
+                return False
+            task = self._tasks[key] = _Task(key, owner, steps)
+            self._stats["submitted"] += 1
+            executor = self._executor
+        executor.submit(self._run, task)
+        return True
+
+    def cancel(self, owner):
+        # A step already running finishes (whoever needs it joins it
+        # through single flight); the rest are dropped.
+        with self._lock:
+            for key, task in list(self._tasks.items()):
+                if task.owner == owner:
+                    task.cancelled = True
+                    # Free the key for the rerun asking again.
+                    del self._tasks[key]
+            self._idle.notify_all()
+
+    def _wait_for_idle(self, task):
+        deadline = self._timer() + self.idle_wait
+        with self._lock:
+            while task.owner in self._foreground and not task.cancelled:
+                remaining = deadline - self._timer()
+                if remaining <= 0:
+                    return "expired"
+                self._idle.wait(remaining)
+            if task.cancelled:
+                return "cancelled"
+        return None
+
+    def _run(self, task):
+        steps = task.steps()
+        outcome = "failed"
+        try:
+            while True:
+                outcome = self._wait_for_idle(task)
+                if outcome is not None:
+                    break
+                throttle.shared.acquire(expensive=True)
+                try:
+                    next(steps)
+                except StopIteration:
+                    outcome = "completed"
+                    break
+        except throttle.Throttled:
+            outcome = "shed"
+        except Exception as e:
+            logger.warning(f"Prefetch of {task.key} failed: {str(e)}")
+            outcome = "failed"
+        finally:
+            steps.close()
+            with self._lock:
+                if self._tasks.get(task.key) is task:
+                    del self._tasks[task.key]
+                self._stats[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._tasks)
+        return stats
+
+
+# Process-wide pool shared by every session.
+shared = Prefetcher()
+
+
+def configure(settings):
+    # [prefetch] ENABLED = true, WORKERS = 2, MAX_PENDING = 8, ...
+    shared.configure(
+        enabled=settings.get("ENABLED", False),
+        workers=settings.get("WORKERS", DEFAULT_WORKERS),
+        max_pending=settings.get("MAX_PENDING", DEFAULT_MAX_PENDING),
+        idle_wait=settings.get("IDLE_WAIT_SECONDS", DEFAULT_IDLE_WAIT_SECONDS))
@@ -0,0 +1,68 @@
+import json
+
+# Fields each view renders; dotted paths select inside nested objects.
+VIEW_FIELDS = {
+    "tweet_card": (
+        "id", "text", "created_at", "conversation_id", "media",
+        "public_metrics", "referenced_tweets",
+        "author.name", "author.username", "author.profile_image_url",
+    ),
+    "tweet_details": (
+        "id", "conversation_id", "lang", "possibly_sensitive",
+        "reply_settings", "edit_controls",
+        "author.id", "author.created_at", "author.description",
+        "author.location", "author.verified", "author.verified_type",
+        "author.public_metrics",
+    ),
+    # Sync projections; _ts is their watermark.
+    "rollup": ("id", "created_at", "public_metrics", "author.username", "_ts"),
+    "day_index": ("id", "created_at", "author.username", "_ts"),
+}
+
+
+def select_clause(fields, alias="c"):
+    # ("id", "author.name") -> 'c.id, {"name": c.author.name} AS author'
+    columns = []
+    nested = {}
+    for field in fields:
+        top, _, rest = field.partition(".")
+        if rest:
+            if top not in nested:
+                nested[top] = []
+                columns.append(top)
+            nested[top].append(rest)
+        else:
+            columns.append(field)
+
+    parts = []
+    for column in columns:
+        if column in nested:
+            members = ", ".join(
+                f"{json.dumps(member)}: {alias}.{column}.{member}"
+                for member in nested[column])
+            parts.append(f"{{{members}}} AS {column}")
+        else:
+            parts.append(f"{alias}.{column}")
+    return ", ".join(parts)
+
+
+def select(view, alias="c"):
+    return select_clause(VIEW_FIELDS[view], alias)
+
+
+def project(doc, fields):
+    # The select_clause() shape, applied to a document already in hand:
+    # ("id", "author.name") -> {"id": ..., "author": {"name": ...}}
+    result = {}
+    for field in fields:
+        source, target = doc, result
+        parts = field.split(".")
+        for part in parts[:-1]:
+            source = source.get(part) if isinstance(source, dict) else None
+            if source is None:
+                break
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+    return result
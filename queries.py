@@ -0,0 +1,192 @@
+import json
+import logging
+import re
+import threading
+
+from cachetools import LRUCache
+
+import paging
+import projections
+
+logger = logging.getLogger(__name__)
+
+PLAN_CACHE_SIZE = 256
+
+PARAM = re.compile(r"@(\w+)")
+# Filters whose parameter can narrow the query plan's partition ranges.
+EQUALITY = re.compile(r"\b(c(?:\.\w+)+)\s*=\s*@(\w+)|@(\w+)\s*=\s*(c(?:\.\w+)+)\b")
+ARRAY_CONTAINS = re.compile(r"ARRAY_CONTAINS\(\s*@(\w+)\s*,\s*(c(?:\.\w+)+)\s*\)")
+
+# Statement text -> which parameters the query plan depends on. Everything
+# else can change without invalidating a cached plan.
+_plan_params = {}
+_plan_params_lock = threading.Lock()
+
+
+def _document_path(expression):
+    # "c.author.username" -> "/author/username"
+    return "/" + "/".join(expression.split(".")[1:])
+
+
+class Statement:
+    # One query shape: the text never changes, values are bound as
+    # @parameters. Declared once below and shared by every app.
+    def __init__(self, view=None, select=None, filters=(), group_by=None,
+                 order_by=None, top=None, value=False):
+        projection = select if select is not None else projections.select(view)
+        parts = ["SELECT"]
+        if top is not None:
+            parts.append(f"TOP @{top}")
+        if value:
+            parts.append("VALUE")
+        parts.append(projection)
+        parts.append("FROM c")
+        if filters:
+            parts.append("WHERE " + " AND ".join(filters))
+        if group_by:
+            parts.append(f"GROUP BY {group_by}")
+        if order_by:
+            parts.append(f"ORDER BY {order_by}")
+        self.text = " ".join(parts)
+        self.param_names = tuple(dict.fromkeys(PARAM.findall(self.text)))
+
+        filter_text = " AND ".join(filters)
+        self.filter_paths = {}
+        for left_path, left_param, right_param, right_path in \
+                EQUALITY.findall(filter_text):
+            self.filter_paths[left_param or right_param] = \
+                _document_path(left_path or right_path)
+        for param, path in ARRAY_CONTAINS.findall(filter_text):
+            self.filter_paths[param] = _document_path(path)
+        self.limit_params = (top,) if top is not None else ()
+        with _plan_params_lock:
+            _plan_params[self.text] = self
+
+    def bind(self, **values):
+        missing = [name for name in self.param_names if name not in values]
+        unknown = [name for name in values if name not in self.param_names]
+        if missing or unknown:
+            raise ValueError(
+                f"Parameters for query don't match: missing {missing}, unknown {unknown}")
+        return [{"name": f"@{name}", "value": values[name]}
+                for name in self.param_names]
+
+    def query(self, container, max_item_count=None, **values):
+        return container.query_items(
+            query=self.text,
+            parameters=self.bind(**values),
+            enable_cross_partition_query=True,
+            max_item_count=max_item_count)
+
+    def pages(self, page_size=paging.PAGE_SIZE, decode=None, **values):
+        return paging.PagedQuery(self.text, self.bind(**values),
+                                 page_size=page_size, decode=decode)
+
+    def plan_key(self, parameters, partition_key_path):
+        # A plan bakes in TOP and the partition ranges a filter on the
+        # partition key narrows it to; other values don't touch it.
+        values = {p["name"][1:]: p["value"] for p in parameters or []}
+        names = list(self.limit_params) + [
+            name for name, path in self.filter_paths.items()
+            if path == partition_key_path]
+        return tuple((name, json.dumps(values.get(name), sort_keys=True))
+                     for name in sorted(names))
+
+
+# "Last 10 Elon Tweets", "All Tweet Threads" and the change feed seed.
+LATEST_TWEETS = Statement(
+    "tweet_card", order_by="c.created_at DESC", top="limit")
+LATEST_BY_AUTHOR = Statement(
+    "tweet_card", filters=["c.author.username = @username"],
+    order_by="c.created_at DESC", top="limit")
+
+# "Tweets by Date". A day is a half-open created_at range, so the range index serves it
+# and the bounds can be any timezone's midnights (see dates.day_range).
+BY_AUTHOR_IN_RANGE = Statement(
+    "tweet_card",
+    filters=["c.author.username = @username", "c.created_at >= @start",
+             "c.created_at < @end"],
+    order_by="c.created_at DESC")
+
+# The details expander.
+TWEET_DETAILS = Statement("tweet_details", filters=["c.id = @id"])
+
+# Thread resolution.
+TWEET_BY_ID = Statement("tweet_card", filters=["c.id = @id"])
+TWEETS_BY_IDS = Statement("tweet_card", filters=["ARRAY_CONTAINS(@ids, c.id)"])
+METRICS_BY_IDS = Statement(
+    select="c.id, c.public_metrics", filters=["ARRAY_CONTAINS(@ids, c.id)"])
+# One conversation at a time, so the limit caps each on its own and a long
+# one can't crowd the rest out. Oldest first, so a conversation cut off by
+# the limit still has the ancestors the page's threads need.
+CONVERSATION = Statement(
+    "tweet_card",
+    filters=["c.conversation_id = @conversation_id"],
+    order_by="c.created_at ASC", top="limit")
+
+# "Tweet Frequency".
+DAILY_COUNTS = Statement(
+    select="SUBSTRING(c.created_at, 0, 10) AS day, COUNT(1) AS tweets",
+    filters=["c.author.username = @username"],
+    group_by="SUBSTRING(c.created_at, 0, 10)")
+DAY_VALUES = Statement(
+    select="SUBSTRING(c.created_at, 0, 10)", value=True,
+    filters=["c.author.username = @username"])
+
+
+class PlanCache:
+    # Wraps the client connection's query plan fetch so each statement
+    # shape costs one gateway round trip per process instead of one per
+    # execution.
+    def __init__(self, fetch, partition_key_path, maxsize=PLAN_CACHE_SIZE):
+        self._fetch = fetch
+        self.partition_key_path = partition_key_path
+        self._plans = LRUCache(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, query, resource_link):
+        if isinstance(query, dict):
+            text, parameters = query.get("query"), query.get("parameters")
+        else:
+            text, parameters = query, None
+        with _plan_params_lock:
+            statement = _plan_params.get(text)
+        if statement is not None:
+            values = statement.plan_key(parameters, self.partition_key_path)
+        else:
+            # Not one of ours: only reuse for the exact same values.
+            values = json.dumps(parameters, sort_keys=True)
+        return resource_link, text, values
+
+    def __call__(self, query, resource_link, **kwargs):
+        key = self._key(query, resource_link)
+        with self._lock:
+            plan = self._plans.get(key)
+            if plan is not None:
+                self.hits += 1
+                return plan
+            self.misses += 1
+        plan = self._fetch(query, resource_link, **kwargs)
+        with self._lock:
+            self._plans[key] = plan
+        return plan
+
+    def stats(self):
+        with self._lock:
+            return {"plans": len(self._plans), "hits": self.hits,
+                    "misses": self.misses}
+
+
+def install_plan_cache(client_connection, partition_key_path):
+    # _GetQueryPlanThroughGateway is private to azure-cosmos; if a release
+    # renames it, queries fetch their plans uncached as they did before.
+    if not callable(getattr(client_connection, "_GetQueryPlanThroughGateway", None)):
+        logger.warning("This azure-cosmos has no _GetQueryPlanThroughGateway, "
+                       "query plans won't be cached")
+        return None
+    plan_cache = PlanCache(client_connection._GetQueryPlanThroughGateway,
+                           partition_key_path)
+    client_connection._GetQueryPlanThroughGateway = plan_cache
+    return plan_cache
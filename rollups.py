@@ -0,0 +1,223 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import queries
+from models import METRIC_FIELDS
+
+logger = logging.getLogger(__name__)
+
+ALL_AUTHORS = "*"
+FIELDS = ("tweets",) + METRIC_FIELDS
+GRAINS = ("hour", "day", "week", "month", "hour_of_week")
+SYNC_PAGE_SIZE = 1000
+
+# The values each tweet last contributed are kept alongside the counters,
+# so a changed tweet adds only the difference and a replayed one adds
+# nothing.
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS contributions (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    {", ".join(f"{field} INTEGER NOT NULL" for field in METRIC_FIELDS)}
+);
+CREATE TABLE IF NOT EXISTS rollups (
+    grain TEXT NOT NULL,
+    username TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    {", ".join(f"{field} INTEGER NOT NULL DEFAULT 0" for field in FIELDS)},
+    PRIMARY KEY (grain, username, bucket)
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+UPSERT = (
+    f"INSERT INTO rollups (grain, username, bucket, {', '.join(FIELDS)}) "
+    f"VALUES (?, ?, ?, {', '.join('?' for _ in FIELDS)}) "
+    "ON CONFLICT (grain, username, bucket) DO UPDATE SET " +
+    ", ".join(f"{field} = {field} + excluded.{field}" for field in FIELDS)
+)
+
+# On _ts rather than created_at, so a tweet ingested late is still picked up.
+SYNC = queries.Statement(
+    "rollup", filters=["c._ts >= @watermark"],
+    order_by="c._ts ASC")
+
+
+def buckets(created_at):
+    # "2024-05-01T10:15:00.000Z" -> one bucket per grain, all UTC. Weeks
+    # are labelled by their Monday; hour_of_week is "<weekday>-<hour>"
+    # with Monday as 0.
+    moment = datetime.strptime(created_at[:13], "%Y-%m-%dT%H")
+    monday = moment - timedelta(days=moment.weekday())
+    return {
+        "hour": created_at[:13],
+        "day": created_at[:10],
+        "week": monday.strftime("%Y-%m-%d"),
+        "month": created_at[:7],
+        "hour_of_week": f"{moment.weekday()}-{moment.hour:02d}",
+    }
+
+
+class RollupStore:
+    def __init__(self, path):
+        self.path = path
+        self.last_refresh = 0.0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._refreshing = False
+        self._db = sqlite3.connect(path, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.executescript(SCHEMA)
+
+    @property
+    def watermark(self):
+        # A store synced on created_at has only the old 'watermark' key and
+        # starts over; contributions keep the replay from double counting.
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value FROM state WHERE key = 'ts_watermark'").fetchone()
+        return int(row[0]) if row else None
+
+    @property
+    def ready(self):
+        return self.watermark is not None
+
+    def _set_watermark(self, watermark):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('ts_watermark', ?)",
+                (watermark,))
+
+    def apply(self, docs):
+        # Deltas are summed per bucket first, so a page of tweets costs one
+        # upsert per touched bucket rather than one per tweet.
+        latest = {}
+        for doc in docs:
+            if doc.get("id") and doc.get("created_at"):
+                latest[doc["id"]] = doc
+        if not latest:
+            return 0
+
+        deltas = defaultdict(lambda: [0] * len(FIELDS))
+
+        def add(username, created_at, sign, values):
+            for grain, bucket in buckets(created_at).items():
+                for author in (username, ALL_AUTHORS):
+                    delta = deltas[(grain, author, bucket)]
+                    for i, value in enumerate(values):
+                        delta[i] += sign * value
+
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                contributions = []
+                for tweet_id, doc in latest.items():
+                    username = (doc.get("author") or {}).get("username") or ""
+                    public_metrics = doc.get("public_metrics") or {}
+                    metrics = [public_metrics.get(field) or 0
+                               for field in METRIC_FIELDS]
+                    previous = self._db.execute(
+                        "SELECT * FROM contributions WHERE id = ?",
+                        (tweet_id,)).fetchone()
+                    if previous is not None:
+                        add(previous[1], previous[2], -1, [1] + list(previous[3:]))
+                    add(username, doc["created_at"], 1, [1] + metrics)
+                    contributions.append(
+                        (tweet_id, username, doc["created_at"], *metrics))
+
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO contributions VALUES "
+                    f"(?, ?, ?, {', '.join('?' for _ in METRIC_FIELDS)})",
+                    contributions)
+                self._db.executemany(UPSERT, [
+                    (grain, author, bucket, *delta)
+                    for (grain, author, bucket), delta in deltas.items()
+                    if any(delta)])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return len(latest)
+
+    def sync(self, container):
+        # Pages are applied as they arrive and the watermark follows them;
+        # >= re-reads the boundary second's tweets, which apply() shrugs off.
+        with self._sync_lock:
+            watermark = self.watermark or 0
+            applied = 0
+            pages = SYNC.query(container, max_item_count=SYNC_PAGE_SIZE,
+                               watermark=watermark).by_page()
+            for page in pages:
+                docs = list(page)
+                if not docs:
+                    continue
+                applied += self.apply(docs)
+                watermark = max(watermark, docs[-1]["_ts"])
+                self._set_watermark(watermark)
+            if not self.ready:
+                self._set_watermark(watermark)
+            logger.info(f"Rollup sync applied {applied} tweets")
+            return applied
+
+    def refresh_in_background(self, container, max_age):
+        with self._state_lock:
+            if self._refreshing or time.monotonic() - self.last_refresh < max_age:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.sync(container)
+            except Exception as e:
+                logger.error(f"Rollup sync failed: {str(e)}")
+            finally:
+                self.last_refresh = time.monotonic()
+                self._refreshing = False
+
+        threading.Thread(target=run, name="rollup-sync", daemon=True).start()
+
+    def series(self, grain, field="tweets", username=None, average=False):
+        # One row per bucket, so the cost follows the number of buckets,
+        # not the number of tweets behind them.
+        if grain not in GRAINS:
+            raise ValueError(f"Unknown rollup grain: {grain}")
+        if field not in FIELDS:
+            raise ValueError(f"Unknown rollup field: {field}")
+        value = f"CAST({field} AS REAL) / tweets" if average else field
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT bucket, {value} FROM rollups "
+                "WHERE grain = ? AND username = ? AND tweets > 0 ORDER BY bucket",
+                (grain, username or ALL_AUTHORS)).fetchall()
+        return rows
+
+    def daily_counts(self, username=None):
+        return dict(self.series("day", username=username))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path):
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = RollupStore(path)
+        return _stores[path]
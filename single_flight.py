@@ -0,0 +1,156 @@
+import functools
+import threading
+import time
+
+from cachetools import LRUCache
+
+import throttle
+
+RESULT_CACHE_SIZE = 1024
+
+# How long a finished result keeps answering the same question, per query
+# type. Zero still coalesces calls that overlap; it just doesn't reuse.
+DEFAULT_REUSE_SECONDS = {
+    "latest": 1,
+    "threads": 1,
+    "details": 0,
+    "counts": 30,
+    "pages": 30,
+}
+_reuse_seconds = dict(DEFAULT_REUSE_SECONDS)
+_config_lock = threading.Lock()
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "abandoned", "degraded", "expires")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.abandoned = False
+        self.degraded = False
+        self.expires = 0.0
+
+
+class SingleFlight:
+    # Identical calls from any session share whichever one started first;
+    # results are handed to every caller as is, so they must be treated as
+    # read-only.
+    def __init__(self, max_results=RESULT_CACHE_SIZE, timer=time.monotonic):
+        self._in_flight = {}
+        self._results = LRUCache(maxsize=max_results)
+        self._lock = threading.Lock()
+        self._timer = timer
+        self.executions = 0
+        self.coalesced = 0
+        self.reused = 0
+
+    def do(self, key, func, reuse_seconds=0):
+        while True:
+            with self._lock:
+                call = self._results.get(key)
+                if call is not None:
+                    if call.expires > self._timer():
+                        self.reused += 1
+                        return self._share(call)
+                    del self._results[key]
+                call = self._in_flight.get(key)
+                leader = call is None
+                if leader:
+                    call = self._in_flight[key] = _Call()
+                    self.executions += 1
+                else:
+                    self.coalesced += 1
+
+            if leader:
+                return self._run(key, call, func, reuse_seconds)
+
+            call.done.wait()
+            if call.abandoned:
+                # The leader's rerun was stopped, not failed; ask again.
+                continue
+            if call.error is not None:
+                raise call.error
+            return self._share(call)
+
+    def _share(self, call):
+        # A stale answer is stale for everyone it's handed to; the notice
+        # goes to their threads too, not just the leader's.
+        if call.degraded:
+            throttle.mark_degraded()
+        return call.result
+
+    def _run(self, key, call, func, reuse_seconds):
+        # Set aside whatever this thread was already told, so the flag
+        # left afterwards says whether func() itself served a stale answer.
+        degraded = throttle.take_degraded()
+        try:
+            call.result = func()
+            call.degraded = throttle.take_degraded()
+        except Exception as e:
+            call.error = e
+            raise
+        except BaseException:
+            # e.g. Streamlit stopping the script for a rerun.
+            call.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+                if call.error is None and not call.abandoned and reuse_seconds > 0:
+                    call.expires = self._timer() + reuse_seconds
+                    self._results[key] = call
+            call.done.set()
+            if degraded:
+                throttle.mark_degraded()
+        return self._share(call)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+                "reused": self.reused,
+                "in_flight": len(self._in_flight),
+                "results": len(self._results),
+            }
+
+
+# Process-wide instance shared by every session.
+shared = SingleFlight()
+
+
+def configure(settings):
+    # [single_flight] LATEST_SECONDS = 2, THREADS_SECONDS = 0, ...
+    with _config_lock:
+        for kind, default in DEFAULT_REUSE_SECONDS.items():
+            _reuse_seconds[kind] = float(
+                settings.get(f"{kind.upper()}_SECONDS", default))
+
+
+def reuse_seconds(kind):
+    with _config_lock:
+        return _reuse_seconds.get(kind, 0)
+
+
+def coalesce(kind, key=None):
+    # The first argument is the process-wide container (or store) and is
+    # left out of the key; key() maps the rest to something hashable.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(resource, *args, **kwargs):
+            if key is not None:
+                question = key(*args, **kwargs)
+            else:
+                question = (args, tuple(sorted(kwargs.items())))
+            return shared.do(
+                (func.__module__, func.__name__, question),
+                lambda: func(resource, *args, **kwargs),
+                reuse_seconds=reuse_seconds(kind))
+        return wrapper
+    return decorator
@@ -0,0 +1,338 @@
+import argparse
+import bisect
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+import projections
+from models import Tweet
+from thread_resolver import build_thread
+
+logger = logging.getLogger(__name__)
+
+# Everything any view renders, details included.
+SNAPSHOT_FIELDS = tuple(dict.fromkeys(
+    projections.VIEW_FIELDS["tweet_card"] + projections.VIEW_FIELDS["tweet_details"]))
+
+TWEETS_FILE = "tweets.arrow"
+INDEX_FILE = "id_index.arrow"
+COUNTS_FILE = "daily_counts.arrow"
+MANIFEST_FILE = "manifest.json"
+FORMAT_VERSION = 1
+
+BUILD_BATCH_ROWS = 50_000
+SCAN_ROWS = 4096
+
+# Sorted by created_at ascending; doc is the projected document as JSON.
+SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("created_at", pa.string()),
+    ("username", pa.string()),
+    ("doc", pa.string()),
+])
+COUNTS_SCHEMA = pa.schema([
+    ("username", pa.string()),
+    ("day", pa.string()),
+    ("tweets", pa.int64()),
+])
+
+
+def _id_hash(tweet_id):
+    return zlib.crc32(tweet_id.encode("utf-8"))
+
+
+def _write_ipc(path, table):
+    # Uncompressed IPC file, so readers can map it rather than decode it.
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        # Readable by app workers running as another user.
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _read_ipc(path):
+    # Zero-copy: the table's buffers point into the mapped file, which the
+    # page cache shares with every other process reading it.
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def build(output_dir, docs):
+    # Done once per snapshot, so it can afford to hold the columns and
+    # sort them; readers never do either.
+    os.makedirs(output_dir, exist_ok=True)
+    started = time.perf_counter()
+    batches = []
+    columns = {name: [] for name in SCHEMA.names}
+
+    def flush():
+        if columns["id"]:
+            batches.append(pa.RecordBatch.from_pydict(columns, schema=SCHEMA))
+            for values in columns.values():
+                values.clear()
+
+    for doc in docs:
+        if not doc.get("id") or not doc.get("created_at"):
+            continue
+        doc = projections.project(doc, SNAPSHOT_FIELDS)
+        columns["id"].append(doc["id"])
+        columns["created_at"].append(doc["created_at"])
+        columns["username"].append((doc.get("author") or {}).get("username"))
+        columns["doc"].append(json.dumps(doc, separators=(",", ":"), ensure_ascii=False))
+        if len(columns["id"]) >= BUILD_BATCH_ROWS:
+            flush()
+    flush()
+
+    table = pa.Table.from_batches(batches, schema=SCHEMA)
+    table = table.take(pc.sort_indices(table, sort_keys=[("created_at", "ascending")]))
+    table = table.combine_chunks()
+
+    # Open addressing with linear probing; a slot holds row + 1, 0 is empty.
+    ids = table.column("id").to_pylist()
+    size = 1
+    while size < 2 * max(len(ids), 1):
+        size *= 2
+    mask = size - 1
+    slots = [0] * size
+    for row, tweet_id in enumerate(ids):
+        slot = _id_hash(tweet_id) & mask
+        while slots[slot]:
+            if ids[slots[slot] - 1] == tweet_id:
+                break
+            slot = (slot + 1) & mask
+        slots[slot] = row + 1
+    index = pa.table({"row": pa.array(slots, type=pa.int64())})
+
+    days = pc.utf8_slice_codeunits(table.column("created_at"), 0, 10)
+    grouped = pa.table({"username": table.column("username"), "day": days}) \
+        .group_by(["username", "day"]).aggregate([([], "count_all")])
+    counts = pa.table({
+        "username": grouped.column("username"),
+        "day": grouped.column("day"),
+        "tweets": grouped.column("count_all").cast(pa.int64()),
+    }, schema=COUNTS_SCHEMA)
+
+    _write_ipc(os.path.join(output_dir, TWEETS_FILE), table)
+    _write_ipc(os.path.join(output_dir, INDEX_FILE), index)
+    _write_ipc(os.path.join(output_dir, COUNTS_FILE), counts)
+    created_at = table.column("created_at")
+    manifest = {
+        "version": FORMAT_VERSION,
+        "tweets": table.num_rows,
+        "oldest": created_at[0].as_py() if table.num_rows else None,
+        "newest": created_at[-1].as_py() if table.num_rows else None,
+        "built_at": time.time(),
+    }
+    # The manifest goes last: a snapshot without one is incomplete.
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(output_dir, MANIFEST_FILE))
+    logger.info(f"Built a {table.num_rows} tweet snapshot in "
+                f"{time.perf_counter() - started:.1f}s: {output_dir}")
+    return manifest
+
+
+class _Column:
+    # Just enough of a sequence for bisect over an Arrow column.
+    def __init__(self, column):
+        self._column = column
+
+    def __len__(self):
+        return len(self._column)
+
+    def __getitem__(self, i):
+        return self._column[i].as_py()
+
+
+class Rows:
+    # Row numbers into the snapshot, decoded to tweets only when sliced,
+    # so a PagedList over a busy day costs one page at a time.
+    def __init__(self, snapshot, rows):
+        self._snapshot = snapshot
+        self._rows = rows
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._snapshot.tweet(row) for row in self._rows[key]]
+        return self._snapshot.tweet(self._rows[key])
+
+
+class Snapshot:
+    # Stands in for the container: the data layer serves every view from
+    # these mapped files when [snapshot] PATH is set.
+    is_snapshot = True
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot version: {self.manifest.get('version')}")
+        table = _read_ipc(os.path.join(path, TWEETS_FILE))
+        self._ids = table.column("id")
+        self._created_at = table.column("created_at")
+        self._usernames = table.column("username")
+        self._docs = table.column("doc")
+        self._slots = _read_ipc(os.path.join(path, INDEX_FILE)).column("row")
+        self._mask = len(self._slots) - 1
+        self._counts = _read_ipc(os.path.join(path, COUNTS_FILE))
+
+    def __len__(self):
+        return len(self._ids)
+
+    def doc(self, row):
+        return json.loads(self._docs[row].as_py())
+
+    def tweet(self, row):
+        return Tweet.from_doc(self.doc(row))
+
+    def find(self, tweet_id):
+        slot = _id_hash(tweet_id) & self._mask
+        while True:
+            row = self._slots[slot].as_py() - 1
+            if row < 0:
+                return None
+            if self._ids[row].as_py() == tweet_id:
+                return row
+            slot = (slot + 1) & self._mask
+
+    def get(self, tweet_id):
+        row = self.find(tweet_id)
+        return self.tweet(row) if row is not None else None
+
+    def details(self, tweet_id):
+        row = self.find(tweet_id)
+        if row is None:
+            return {}
+        return projections.project(self.doc(row), projections.VIEW_FIELDS["tweet_details"])
+
+    def _rows_by(self, start, end, username):
+        # Newest first, like the ORDER BY created_at DESC queries.
+        if username is None:
+            return range(end - 1, start - 1, -1)
+        if start >= end:
+            return []
+        matches = pc.indices_nonzero(
+            pc.equal(self._usernames.slice(start, end - start), username))
+        return matches.to_numpy()[::-1] + start
+
+    def latest(self, limit, username=None):
+        tweets = []
+        end = len(self)
+        while end > 0 and len(tweets) < limit:
+            start = max(0, end - SCAN_ROWS)
+            for row in self._rows_by(start, end, username):
+                tweets.append(self.tweet(row))
+                if len(tweets) == limit:
+                    break
+            end = start
+        return tweets
+
+    def tweets_between(self, start, end, username=None):
+        # created_at is sorted, so [start, end) is one contiguous run of rows.
+        created_at = _Column(self._created_at)
+        first = bisect.bisect_left(created_at, start)
+        last = bisect.bisect_left(created_at, end, lo=first)
+        return Rows(self, self._rows_by(first, last, username))
+
+    def daily_counts(self, username=None):
+        counts = {}
+        table = self._counts
+        if username is not None:
+            table = table.filter(pc.equal(table.column("username"), username))
+        for day, tweets in zip(table.column("day").to_pylist(),
+                               table.column("tweets").to_pylist()):
+            counts[day] = counts.get(day, 0) + tweets
+        return counts
+
+    def resolve_threads(self, tweets):
+        known = {tweet.id: tweet for tweet in tweets}
+        for tweet in tweets:
+            current = tweet.parent_id
+            while current is not None and current not in known:
+                parent = self.get(current)
+                if parent is None:
+                    break
+                known[current] = parent
+                current = parent.parent_id
+        return [build_thread(tweet, known) for tweet in tweets]
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def open_snapshot(path):
+    path = os.path.abspath(path)
+    with _snapshots_lock:
+        if path not in _snapshots:
+            started = time.perf_counter()
+            _snapshots[path] = Snapshot(path)
+            logger.info(f"Opened a {len(_snapshots[path])} tweet snapshot in "
+                        f"{(time.perf_counter() - started) * 1000:.1f}ms: {path}")
+        return _snapshots[path]
+
+
+def _cosmos_docs(page_size):
+    import streamlit as st
+
+    import cosmos_pool
+    import queries
+    import throttle
+
+    container = cosmos_pool.get_container(st.secrets["cosmosdb"])
+    statement = queries.Statement(select=projections.select_clause(SNAPSHOT_FIELDS))
+    pages = statement.query(container, max_item_count=page_size).by_page()
+    while True:
+        page = throttle.shared.run(lambda: list(next(pages, [])))
+        if not page:
+            return
+        yield from page
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Build a read-only snapshot the apps can serve from with "
+                    "no Cosmos DB connection ([snapshot] PATH).")
+    parser.add_argument("output_dir")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--ndjson",
+                        help="file, directory of *.ndjson, or comma-separated "
+                             "list, e.g. the output of export.py")
+    source.add_argument("--from-cosmos", action="store_true",
+                        help="read the container named in the [cosmosdb] secrets")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.ndjson:
+        import fake_cosmos
+        docs = fake_cosmos.read_ndjson(args.ndjson)
+    else:
+        docs = _cosmos_docs(args.page_size)
+    manifest = build(args.output_dir, docs)
+    print(json.dumps(manifest), file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+FIRST_ID = 1790000000000000000
+MEDIA_TYPES = ("photo", "video")
+WORDS = (
+    "rocket", "launch", "mars", "tesla", "ai", "engine", "starship", "orbit",
+    "battery", "factory", "production", "software", "update", "wow", "true",
+    "exactly", "interesting", "great", "progress", "team", "next", "week",
+    "soon", "maybe", "haha", "indeed", "concerning", "💯", "🚀", "!!",
+)
+
+
+def _author(i):
+    if i == 0:
+        username, name = "elonmusk", "Elon Musk"
+    else:
+        username, name = f"user{i}", f"User {i}"
+    return {
+        "id": str(44196397 + i),
+        "name": name,
+        "username": username,
+        "profile_image_url": f"https://pbs.twimg.com/profile_images/{i}/normal.jpg",
+        "created_at": "2009-06-02T20:12:29.000Z",
+        "description": f"Synthetic account {i}",
+        "location": "Earth",
+        "verified": i % 4 == 0,
+        "verified_type": "blue" if i % 4 == 0 else "none",
+        "public_metrics": {"followers_count": 1000 * (i + 1),
+                           "following_count": 100, "tweet_count": 5000,
+                           "listed_count": 10},
+    }
+
+
+def _media(rng, tweet_id, media_ratio, video_ratio):
+    if rng.random() >= media_ratio:
+        return None
+    items = []
+    for n in range(rng.choice((1, 1, 1, 2, 4))):
+        media_key = f"3_{tweet_id}{n}"
+        if rng.random() < video_ratio:
+            items.append({
+                "type": "video", "media_key": media_key,
+                "preview_image_url": f"https://pbs.twimg.com/ext_tw_video_thumb/{media_key}.jpg",
+            })
+        else:
+            items.append({
+                "type": "photo", "media_key": media_key,
+                "url": f"https://pbs.twimg.com/media/{media_key}.jpg",
+            })
+    return items
+
+
+def generate(count, authors=50, elon_share=0.3, max_depth=5,
+             reply_ratio=0.6, media_ratio=0.2, video_ratio=0.25, days=365,
+             end=None, seed=0):
+    # Yields documents shaped like the ingested tweets, oldest first, as a
+    # series of conversations: a root, then a chain of replies up to
+    # max_depth long, each replying to the one before.
+    rng = random.Random(seed)
+    people = [_author(i) for i in range(max(authors, 1))]
+    end = end or datetime(2024, 6, 1, tzinfo=timezone.utc)
+    moment = end - timedelta(days=days)
+    mean_gap = days * 86400 / max(count, 1)
+
+    emitted = 0
+    while emitted < count:
+        root_id = str(FIRST_ID + emitted)
+        parent = None
+        depth = 0
+        while emitted < count:
+            tweet_id = str(FIRST_ID + emitted)
+            if rng.random() < elon_share or len(people) == 1:
+                author = people[0]
+            else:
+                author = people[rng.randrange(1, len(people))]
+            moment += timedelta(seconds=rng.expovariate(1 / mean_gap))
+            impressions = rng.randrange(1000, 50_000_000)
+            doc = {
+                "id": tweet_id,
+                "text": " ".join(rng.choice(WORDS)
+                                 for _ in range(rng.randrange(1, 40))),
+                "created_at": moment.strftime("%Y-%m-%dT%H:%M:%S.") +
+                f"{moment.microsecond // 1000:03d}Z",
+                "author": author,
+                "conversation_id": root_id,
+                "lang": "en",
+                "possibly_sensitive": False,
+                "reply_settings": "everyone",
+                "edit_controls": {"edits_remaining": 5,
+                                  "is_edit_eligible": parent is None},
+                "public_metrics": {
+                    "retweet_count": impressions // 2000,
+                    "reply_count": impressions // 5000,
+                    "like_count": impressions // 100,
+                    "quote_count": impressions // 20000,
+                    "bookmark_count": impressions // 10000,
+                    "impression_count": impressions,
+                },
+            }
+            if parent is not None:
+                doc["referenced_tweets"] = [{"type": "replied_to", "id": parent}]
+            media = _media(rng, tweet_id, media_ratio, video_ratio)
+            if media:
+                doc["media"] = media
+            yield doc
+
+            emitted += 1
+            parent = tweet_id
+            depth += 1
+            if depth > max_depth or rng.random() >= reply_ratio:
+                break
+
+
+def write_ndjson(path, docs):
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for doc in docs:
+            f.write(json.dumps(doc, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Write a synthetic tweet corpus as NDJSON.")
+    parser.add_argument("output")
+    parser.add_argument("--tweets", type=int, default=10_000)
+    parser.add_argument("--authors", type=int, default=50)
+    parser.add_argument("--elon-share", type=float, default=0.3)
+    parser.add_argument("--max-depth", type=int, default=5)
+    parser.add_argument("--reply-ratio", type=float, default=0.6)
+    parser.add_argument("--media-ratio", type=float, default=0.2)
+    parser.add_argument("--video-ratio", type=float, default=0.25)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    count = write_ndjson(args.output, generate(
+        args.tweets, authors=args.authors, elon_share=args.elon_share,
+        max_depth=args.max_depth, reply_ratio=args.reply_ratio,
+        media_ratio=args.media_ratio, video_ratio=args.video_ratio,
+        days=args.days, seed=args.seed))
+    print(f"Wrote {count} tweets to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import functools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "ets"
+
+# Spans opened by the current Streamlit script run live on its thread; the
+# process-wide totals behind the Prometheus export are shared.
+_local = threading.local()
+_lock = threading.Lock()
+_totals = {}
+_rerun_totals = {}
+_cosmos_totals = {"requests": 0, "request_charge": 0.0, "items": 0, "bytes": 0}
+_exports = {"jsonl_path": None, "prometheus_path": None}
+
+
+class Span:
+    __slots__ = ("name", "kind", "depth", "seconds", "requests",
+                 "request_charge", "items", "bytes", "error")
+
+    def __init__(self, name, kind, depth=0):
+        self.name = name
+        self.kind = kind
+        self.depth = depth
+        self.seconds = 0.0
+        self.requests = 0
+        self.request_charge = 0.0
+        self.items = 0
+        self.bytes = 0
+        self.error = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "depth": self.depth,
+            "ms": round(self.seconds * 1000, 2),
+            "requests": self.requests,
+            "request_charge": round(self.request_charge, 2),
+            "items": self.items,
+            "bytes": self.bytes,
+            "error": self.error,
+        }
+
+
+def configure(jsonl_path=None, prometheus_path=None):
+    with _lock:
+        _exports.update(jsonl_path=jsonl_path, prometheus_path=prometheus_path)
+
+
+def _stack():
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _add_totals(totals, key, span):
+    entry = totals.get(key)
+    if entry is None:
+        entry = totals[key] = {"calls": 0, "errors": 0, "seconds": 0.0,
+                               "requests": 0, "request_charge": 0.0,
+                               "items": 0, "bytes": 0}
+    entry["calls"] += 1
+    entry["errors"] += span.error is not None
+    entry["seconds"] += span.seconds
+    entry["requests"] += span.requests
+    entry["request_charge"] += span.request_charge
+    entry["items"] += span.items
+    entry["bytes"] += span.bytes
+
+
+@contextmanager
+def span(name, kind):
+    stack = _stack()
+    current = Span(name, kind, depth=len(stack))
+    stack.append(current)
+    spans = getattr(_local, "spans", None)
+    if spans is not None:
+        spans.append(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except Exception as e:
+        current.error = type(e).__name__
+        raise
+    finally:
+        current.seconds = time.perf_counter() - started
+        stack.pop()
+        with _lock:
+            _add_totals(_totals, (kind, name), current)
+
+
+def instrument(kind):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(func.__name__, kind):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_response(headers, size):
+    # One Cosmos round trip, charged to every span open on this thread (so
+    # a span's numbers include its children's) and to the current rerun.
+    try:
+        charge = float(headers.get("x-ms-request-charge") or 0)
+        items = int(headers.get("x-ms-item-count") or 0)
+    except ValueError:
+        charge, items = 0.0, 0
+    targets = list(_stack())
+    run = getattr(_local, "run", None)
+    if run is not None:
+        targets.append(run)
+    for target in targets:
+        target.requests += 1
+        target.request_charge += charge
+        target.items += items
+        target.bytes += size
+    with _lock:
+        _cosmos_totals["requests"] += 1
+        _cosmos_totals["request_charge"] += charge
+        _cosmos_totals["items"] += items
+        _cosmos_totals["bytes"] += size
+
+
+def record_pipeline_response(response):
+    # raw_response_hook for the azure-core pipeline behind CosmosClient.
+    http_response = response.http_response
+    record_response(http_response.headers, response_size(http_response))
+
+
+def response_size(http_response):
+    size = http_response.headers.get("content-length")
+    if size is None:
+        try:
+            size = len(http_response.body() or b"")
+        except Exception:
+            size = 0
+    return int(size)
+
+
+def current_run():
+    return getattr(_local, "run", None)
+
+
+def label_rerun(view):
+    run = current_run()
+    if run is not None:
+        run.name = view
+
+
+def current_spans():
+    return list(getattr(_local, "spans", None) or [])
+
+
+@contextmanager
+def rerun(view=None):
+    run = Span(view or "rerun", "rerun")
+    _local.run = run
+    _local.spans = []
+    started = time.perf_counter()
+    try:
+        yield run
+    except Exception as e:
+        run.error = type(e).__name__
+        raise
+    finally:
+        run.seconds = time.perf_counter() - started
+        spans = _local.spans
+        _local.run = None
+        _local.spans = None
+        with _lock:
+            _add_totals(_rerun_totals, run.name, run)
+            jsonl_path = _exports["jsonl_path"]
+            prometheus_path = _exports["prometheus_path"]
+        try:
+            if jsonl_path:
+                _append_jsonl(jsonl_path, run, spans)
+            if prometheus_path:
+                _write_prometheus(prometheus_path)
+        except OSError as e:
+            logger.error(f"Failed to export telemetry: {str(e)}")
+
+
+def _append_jsonl(path, run, spans):
+    record = dict(run.to_dict(), ts=time.time(), view=run.name,
+                  spans=[s.to_dict() for s in spans])
+    del record["name"], record["kind"], record["depth"]
+    line = json.dumps(record) + "\n"
+    with _lock, open(path, "a") as f:
+        f.write(line)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text():
+    with _lock:
+        totals = {key: dict(entry) for key, entry in _totals.items()}
+        rerun_totals = {key: dict(entry) for key, entry in _rerun_totals.items()}
+        cosmos = dict(_cosmos_totals)
+
+    lines = []
+
+    def family(name, help_text, samples):
+        lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRIC_PREFIX}_{name} counter")
+        for labels, value in samples:
+            label_text = ",".join(f'{key}="{_escape(val)}"'
+                                  for key, val in labels.items())
+            if label_text:
+                label_text = f"{{{label_text}}}"
+            lines.append(f"{METRIC_PREFIX}_{name}{label_text} {value}")
+
+    def labelled(entries, field, labels):
+        return [(labels(key), entry[field])
+                for key, entry in sorted(entries.items())]
+
+    def span_labels(key):
+        return {"kind": key[0], "name": key[1]}
+
+    def view_labels(key):
+        return {"view": key}
+
+    for field, help_text in (
+            ("calls", "Calls to instrumented functions."),
+            ("errors", "Calls that raised."),
+            ("seconds", "Wall time spent in instrumented functions."),
+            ("requests", "Cosmos DB requests made inside the call."),
+            ("request_charge", "Request units charged inside the call."),
+            ("items", "Items returned by Cosmos DB inside the call."),
+            ("bytes", "Response bytes read inside the call.")):
+        family(f"span_{field}_total", help_text,
+               labelled(totals, field, span_labels))
+    for field, help_text in (
+            ("calls", "Script reruns per view."),
+            ("seconds", "Wall time of script reruns per view."),
+            ("requests", "Cosmos DB requests per view."),
+            ("request_charge", "Request units charged per view.")):
+        family(f"rerun_{field}_total", help_text,
+               labelled(rerun_totals, field, view_labels))
+    for field, help_text in (
+            ("requests", "All Cosmos DB requests, background work included."),
+            ("request_charge", "All request units charged."),
+            ("items", "All items returned."),
+            ("bytes", "All response bytes read.")):
+        family(f"cosmos_{field}_total", help_text,
+               [({}, cosmos[field])])
+    return "\n".join(lines) + "\n"
+
+
+def _write_prometheus(path):
+    # Written whole and renamed, for a textfile collector to pick up.
+    text = prometheus_text()
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    with os.fdopen(fd, "w") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
@@ -0,0 +1,173 @@
+import logging
+import weakref
+from collections import defaultdict
+
+from azure.cosmos.exceptions import CosmosResourceNotFoundError
+
+import models
+import queries
+import tweet_cache
+from models import Tweet
+
+logger = logging.getLogger(__name__)
+
+CONVERSATION_LIMIT = 1000
+
+_partition_key_paths = weakref.WeakKeyDictionary()
+
+
+def _partition_key_path(container):
+    path = _partition_key_paths.get(container)
+    if path is None:
+        paths = container.read().get('partitionKey', {}).get('paths', [])
+        path = paths[0] if len(paths) == 1 else ''
+        _partition_key_paths[container] = path
+    return path
+
+
+def _read_documents(container, ids):
+    # A lone id on an id-partitioned container is a 1 RU point read;
+    # anything else is one cross-partition query for the whole level.
+    if len(ids) == 1 and _partition_key_path(container) == '/id':
+        try:
+            item = container.read_item(item=ids[0], partition_key=ids[0])
+        except CosmosResourceNotFoundError:
+            return {}
+        return {item['id']: Tweet.from_doc(item)}
+
+    items = queries.TWEETS_BY_IDS.query(container, ids=ids)
+    return {item['id']: Tweet.from_doc(item) for item in items}
+
+
+def _read_metrics(container, ids):
+    items = queries.METRICS_BY_IDS.query(container, ids=ids)
+    return {item['id']: item.get('public_metrics', {}) for item in items}
+
+
+def fetch_ancestors(container, tweets):
+    tweet_cache.shared.put_many(tweets)
+    known = {tweet.id: tweet for tweet in tweets}
+    missing = set()
+    stale_ids = []
+
+    # Cached bodies let us keep walking without a round trip; only levels
+    # with uncached ancestors cost a query, and every stale metric on the
+    # page is refreshed together at the end.
+    frontier = {tweet.parent_id for tweet in tweets}
+    round_trips = 0
+    while True:
+        ids = sorted(frontier - known.keys() - missing - {None})
+        if not ids:
+            break
+        fresh, stale, uncached = tweet_cache.shared.lookup(ids)
+        found = {}
+        if uncached:
+            round_trips += 1
+            found = _read_documents(container, uncached)
+            tweet_cache.shared.put_many(found.values())
+            missing.update(i for i in uncached if i not in found)
+        found.update(fresh)
+        found.update(stale)
+        stale_ids.extend(stale)
+        known.update(found)
+        frontier = {tweet.parent_id for tweet in found.values()}
+
+    if stale_ids:
+        round_trips += 1
+        known.update(tweet_cache.shared.update_metrics(
+            _read_metrics(container, stale_ids)))
+
+    logger.debug(
+        f"Resolved ancestors for {len(tweets)} tweets in {round_trips} queries")
+    return known
+
+
+def build_thread(tweet, known):
+    thread = [tweet]
+    seen = {tweet.id}
+    current = tweet.parent_id
+    while current in known and current not in seen:
+        seen.add(current)
+        thread.append(known[current])
+        current = known[current].parent_id
+    thread.reverse()
+    return thread
+
+
+class Conversation:
+    # Every loaded tweet of one conversation, indexed by id and by parent,
+    # so threads and reply trees come out without further round trips.
+    def __init__(self, conversation_id):
+        self.id = conversation_id
+        self.tweets = {}
+        self.children = defaultdict(list)
+
+    def add(self, tweet):
+        self.tweets[tweet.id] = tweet
+        if tweet.parent_id is not None:
+            self.children[tweet.parent_id].append(tweet)
+
+    def thread(self, tweet_id):
+        return build_thread(self.tweets[tweet_id], self.tweets)
+
+    def replies(self, tweet_id):
+        # [(reply, [(reply to reply, [...]), ...]), ...], oldest first.
+        def tree(parent_id, seen):
+            replies = sorted(self.children.get(parent_id, ()),
+                             key=lambda tweet: tweet.created_at or 0)
+            return [(reply, tree(reply.id, seen | {reply.id}))
+                    for reply in replies if reply.id not in seen]
+        return tree(tweet_id, {tweet_id})
+
+
+def load_conversations(container, conversation_ids, limit=CONVERSATION_LIMIT):
+    # One query per conversation, each capped at the limit. Past it the
+    # newest tweets are the ones left out, and the hop-by-hop walk picks
+    # up anything missing.
+    conversations = {}
+    loaded = 0
+    for conversation_id in sorted(conversation_ids):
+        conversation = conversations[conversation_id] = Conversation(conversation_id)
+        tweets = models.from_docs(queries.CONVERSATION.query(
+            container, conversation_id=conversation_id, limit=limit))
+        for tweet in tweets:
+            conversation.add(tweet)
+        tweet_cache.shared.put_many(tweets)
+        loaded += len(tweets)
+    if conversations:
+        logger.debug(
+            f"Loaded {loaded} tweets from {len(conversations)} conversations")
+    return conversations
+
+
+def load_conversation(container, conversation_id, limit=CONVERSATION_LIMIT):
+    return load_conversations(container, [conversation_id], limit)[conversation_id]
+
+
+def conversations_to_load(tweets):
+    # Conversations of tweets whose ancestors aren't all cached yet.
+    known = {tweet.id: tweet for tweet in tweets}
+    pending = set()
+    for tweet in tweets:
+        seen = {tweet.id}
+        current = tweet.parent_id
+        while current is not None and current not in seen:
+            seen.add(current)
+            parent = known.get(current) or tweet_cache.shared.peek(current)
+            if parent is None:
+                if tweet.conversation_id is not None:
+                    pending.add(tweet.conversation_id)
+                break
+            known[current] = parent
+            current = parent.parent_id
+    return pending
+
+
+def resolve_threads(container, tweets):
+    # Conversations are fetched whole first; the ancestor walk then runs
+    # on cached tweets and only goes back to Cosmos for tweets without a
+    # conversation_id or ancestors the conversation query didn't return.
+    tweet_cache.shared.put_many(tweets)
+    load_conversations(container, conversations_to_load(tweets))
+    known = fetch_ancestors(container, tweets)
+    return [build_thread(tweet, known) for tweet in tweets]
@@ -0,0 +1,230 @@
+import functools
+import logging
+import random
+import threading
+import time
+
+from azure.cosmos.exceptions import CosmosHttpResponseError
+from cachetools import LRUCache
+
+logger = logging.getLogger(__name__)
+
+THROTTLED = 429
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_MAX_WAIT_SECONDS = 5.0
+# Share of the bucket expensive queries leave for cheap ones.
+DEFAULT_RESERVE = 0.25
+# After a 429, expensive queries are shed for this long.
+DEFAULT_COOL_DOWN_SECONDS = 10.0
+BASE_BACKOFF_SECONDS = 0.1
+JITTER = 0.25
+STALE_RESULTS_SIZE = 256
+
+_local = threading.local()
+
+
+class Throttled(Exception):
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after_seconds(error):
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("x-ms-retry-after-ms")
+    try:
+        return float(value) / 1000 if value is not None else None
+    except ValueError:
+        return None
+
+
+class RuBudget:
+    # Process-wide token bucket of request units, refilled at the
+    # provisioned RU/s. Responses charge what they actually cost, so the
+    # balance can go negative; callers wait it back to zero before their
+    # next request. Without a provisioned rate only 429s are handled.
+    def __init__(self, ru_per_second=None, max_retries=DEFAULT_MAX_RETRIES,
+                 max_wait=DEFAULT_MAX_WAIT_SECONDS, reserve=DEFAULT_RESERVE,
+                 cool_down=DEFAULT_COOL_DOWN_SECONDS, timer=time.monotonic,
+                 sleep=time.sleep):
+        self._lock = threading.Lock()
+        self._timer = timer
+        self._sleep = sleep
+        self._stale = LRUCache(maxsize=STALE_RESULTS_SIZE)
+        self.configure(ru_per_second, max_retries, max_wait, reserve, cool_down)
+        self._stats = {"charged": 0.0, "waits": 0, "waited_seconds": 0.0,
+                       "throttled": 0, "retries": 0, "shed": 0,
+                       "downgraded": 0, "failed": 0}
+
+    def configure(self, ru_per_second=None, max_retries=DEFAULT_MAX_RETRIES,
+                  max_wait=DEFAULT_MAX_WAIT_SECONDS, reserve=DEFAULT_RESERVE,
+                  cool_down=DEFAULT_COOL_DOWN_SECONDS):
+        settings = (float(ru_per_second) if ru_per_second else None,
+                    int(max_retries), float(max_wait), float(reserve),
+                    float(cool_down))
+        with self._lock:
+            # Called on every rerun; only a change starts the bucket over.
+            if settings == getattr(self, "_settings", None):
+                return
+            self._settings = settings
+            (self.ru_per_second, self.max_retries, self.max_wait,
+             self.reserve, self.cool_down) = settings
+            self._balance = self.ru_per_second or 0.0
+            self._refilled = self._timer()
+            self._blocked_until = 0.0
+            self._last_throttled = None
+
+    def _refill(self, now):
+        if self.ru_per_second:
+            self._balance = min(
+                self.ru_per_second,
+                self._balance + (now - self._refilled) * self.ru_per_second)
+        self._refilled = now
+
+    def charge(self, request_charge):
+        with self._lock:
+            self._refill(self._timer())
+            if self.ru_per_second:
+                self._balance -= request_charge
+            self._stats["charged"] += request_charge
+
+    def record_response(self, headers, size=None):
+        try:
+            request_charge = float(headers.get("x-ms-request-charge") or 0)
+        except ValueError:
+            return
+        if request_charge:
+            self.charge(request_charge)
+
+    def record_pipeline_response(self, response):
+        self.record_response(response.http_response.headers)
+
+    def _backoff(self, delay):
+        # Everyone waits out a 429, not just the request that got it.
+        with self._lock:
+            now = self._timer()
+            self._blocked_until = max(self._blocked_until, now + delay)
+            self._last_throttled = now
+            self._stats["throttled"] += 1
+
+    def acquire(self, expensive=False):
+        with self._lock:
+            now = self._timer()
+            self._refill(now)
+            wait = max(0.0, self._blocked_until - now)
+            if self.ru_per_second and self._balance < 0:
+                wait = max(wait, -self._balance / self.ru_per_second)
+            if expensive:
+                recently_throttled = self._last_throttled is not None and \
+                    now - self._last_throttled < self.cool_down
+                low = self.ru_per_second and \
+                    self._balance < self.reserve * self.ru_per_second
+                if recently_throttled or low or wait > 0:
+                    self._stats["shed"] += 1
+                    raise Throttled("Shedding an expensive query while "
+                                    "Cosmos DB throughput is short",
+                                    retry_after=wait or None)
+            if wait > self.max_wait:
+                self._stats["failed"] += 1
+                raise Throttled("Cosmos DB throughput is exhausted",
+                                retry_after=wait)
+            if wait > 0:
+                self._stats["waits"] += 1
+                self._stats["waited_seconds"] += wait
+        if wait > 0:
+            self._sleep(wait)
+
+    def run(self, func, expensive=False):
+        attempt = 0
+        while True:
+            self.acquire(expensive)
+            try:
+                return func()
+            except CosmosHttpResponseError as e:
+                if e.status_code != THROTTLED:
+                    raise
+                retry_after = _retry_after_seconds(e)
+                if retry_after is None:
+                    retry_after = BASE_BACKOFF_SECONDS * 2 ** attempt
+                # Jitter so the sessions that were throttled together
+                # don't all come back in the same instant.
+                delay = retry_after * (1 + random.uniform(0, JITTER))
+                self._backoff(delay)
+                if expensive or attempt >= self.max_retries:
+                    with self._lock:
+                        self._stats["failed"] += 1
+                    raise Throttled("Cosmos DB returned 429 Too Many Requests",
+                                    retry_after=delay)
+                attempt += 1
+                with self._lock:
+                    self._stats["retries"] += 1
+                logger.info(f"Throttled by Cosmos DB, retrying in {delay:.2f}s")
+
+    def run_or_stale(self, key, func, expensive=False):
+        # Serves the last good answer instead of failing while throttled.
+        try:
+            result = self.run(func, expensive)
+        except Throttled:
+            with self._lock:
+                if key not in self._stale:
+                    raise
+                self._stats["downgraded"] += 1
+                result = self._stale[key]
+            mark_degraded()
+            return result
+        with self._lock:
+            self._stale[key] = result
+        return result
+
+    def stats(self):
+        with self._lock:
+            self._refill(self._timer())
+            stats = dict(self._stats)
+            stats["balance"] = round(self._balance, 2) \
+                if self.ru_per_second else None
+            stats["ru_per_second"] = self.ru_per_second
+        return stats
+
+
+# Process-wide budget shared by every session.
+shared = RuBudget()
+
+
+def configure(settings):
+    shared.configure(
+        ru_per_second=settings.get("PROVISIONED_RU"),
+        max_retries=settings.get("MAX_RETRIES", DEFAULT_MAX_RETRIES),
+        max_wait=settings.get("MAX_WAIT_SECONDS", DEFAULT_MAX_WAIT_SECONDS),
+        reserve=settings.get("RESERVE", DEFAULT_RESERVE),
+        cool_down=settings.get("COOL_DOWN_SECONDS", DEFAULT_COOL_DOWN_SECONDS))
+
+
+def mark_degraded():
+    _local.degraded = True
+
+
+def take_degraded():
+    # Whether this thread was served a stale answer since it last asked.
+    degraded = getattr(_local, "degraded", False)
+    _local.degraded = False
+    return degraded
+
+
+def guarded(expensive=False, stale_ok=False, key=None):
+    # The first argument is the shared container (or store), left out of
+    # the key for stale answers; key() maps the rest to something hashable.
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(resource, *args, **kwargs):
+            def call():
+                return func(resource, *args, **kwargs)
+            if stale_ok:
+                if key is not None:
+                    question = key(*args, **kwargs)
+                else:
+                    question = (args, tuple(sorted(kwargs.items())))
+                return shared.run_or_stale(
+                    (func.__module__, func.__name__, question), call, expensive)
+            return shared.run(call, expensive)
+        return wrapper
+    return decorator
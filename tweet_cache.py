@@ -0,0 +1,128 @@
+import threading
+import time
+
+from cachetools import LRUCache
+
+# Tweet bodies are effectively immutable; public_metrics drift constantly.
+BODY_TTL_SECONDS = 6 * 60 * 60
+METRICS_TTL_SECONDS = 60
+MAX_BYTES = 64 * 1024 * 1024
+
+
+class _Entry:
+    __slots__ = ("tweet", "size", "body_expires", "metrics_expires")
+
+    def __init__(self, tweet, size, body_expires, metrics_expires):
+        self.tweet = tweet
+        self.size = size
+        self.body_expires = body_expires
+        self.metrics_expires = metrics_expires
+
+
+def _entry_size(entry):
+    return entry.size
+
+
+class TweetCache:
+    def __init__(self, max_bytes=MAX_BYTES, body_ttl=BODY_TTL_SECONDS,
+                 metrics_ttl=METRICS_TTL_SECONDS, timer=time.monotonic):
+        self._entries = LRUCache(maxsize=max_bytes, getsizeof=_entry_size)
+        self._lock = threading.Lock()
+        self._body_ttl = body_ttl
+        self._metrics_ttl = metrics_ttl
+        self._timer = timer
+        self.hits = 0
+        self.misses = 0
+        self.stale_metrics = 0
+
+    def lookup(self, ids):
+        # Returns (fresh, stale, missing): fresh tweets can be used as is,
+        # stale ones only need their public_metrics refreshed.
+        fresh, stale, missing = {}, {}, []
+        now = self._timer()
+        with self._lock:
+            for tweet_id in ids:
+                entry = self._entries.get(tweet_id)
+                if entry is None or entry.body_expires <= now:
+                    if entry is not None:
+                        del self._entries[tweet_id]
+                    self.misses += 1
+                    missing.append(tweet_id)
+                elif entry.metrics_expires <= now:
+                    self.stale_metrics += 1
+                    stale[tweet_id] = entry.tweet
+                else:
+                    self.hits += 1
+                    fresh[tweet_id] = entry.tweet
+        return fresh, stale, missing
+
+    def get(self, tweet_id):
+        fresh, _, _ = self.lookup([tweet_id])
+        return fresh.get(tweet_id)
+
+    def peek(self, tweet_id):
+        # Body (fresh or stale metrics) without counting a hit or miss.
+        with self._lock:
+            entry = self._entries.get(tweet_id)
+            if entry is None or entry.body_expires <= self._timer():
+                return None
+            return entry.tweet
+
+    def put_many(self, tweets):
+        now = self._timer()
+        with self._lock:
+            for tweet in tweets:
+                size = tweet.approx_size()
+                if size > self._entries.maxsize:
+                    continue
+                self._entries[tweet.id] = _Entry(
+                    tweet, size, now + self._body_ttl, now + self._metrics_ttl)
+
+    def refresh(self, tweets):
+        # Replace entries we already hold (e.g. from the change feed) without
+        # pulling tweets nobody has asked for into the cache.
+        now = self._timer()
+        with self._lock:
+            for tweet in tweets:
+                if tweet.id not in self._entries:
+                    continue
+                self._entries[tweet.id] = _Entry(
+                    tweet, tweet.approx_size(),
+                    now + self._body_ttl, now + self._metrics_ttl)
+
+    def update_metrics(self, metrics_by_id):
+        # Cached records are shared between sessions, so swap in a copy
+        # rather than mutating the one a render may be holding.
+        now = self._timer()
+        updated = {}
+        with self._lock:
+            for tweet_id, public_metrics in metrics_by_id.items():
+                entry = self._entries.get(tweet_id)
+                if entry is None:
+                    continue
+                tweet = entry.tweet.with_metrics(public_metrics)
+                # Re-inserted, so the LRU's byte count follows the new size.
+                self._entries[tweet_id] = _Entry(
+                    tweet, tweet.approx_size(), entry.body_expires,
+                    now + self._metrics_ttl)
+                updated[tweet_id] = tweet
+        return updated
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_metrics": self.stale_metrics,
+                "entries": len(self._entries),
+                "bytes": self._entries.currsize,
+                "max_bytes": self._entries.maxsize,
+            }
+
+
+# Process-wide instance shared by every session.
+shared = TweetCache()
@@ -0,0 +1,156 @@
+import html
+import threading
+from datetime import datetime, timezone
+
+from cachetools import LRUCache
+
+FRAGMENT_CACHE_SIZE = 4096
+
+STYLES = [
+    ".tweet-container {",
+    "    border: 1px solid #cfd9de;",
+    "    border-radius: 16px;",
+    "    padding: 12px;",
+    "    margin-bottom: 12px;",
+    "    background-color: #ffffff;",
+    "}",
+    ".referenced-tweet {",
+    "    background-color: #f7f9f9;",
+    "}",
+    ".reply-tweet {",
+    "    margin-left: 20px;",
+    "    border-left: 2px solid #cfd9de;",
+    "}",
+    ".replying-to {",
+    "    color: #536471;",
+    "    font-size: 13px;",
+    "    margin-left: 20px;",
+    "    margin-bottom: 5px;",
+    "}",
+    ".tweet-header {",
+    "    display: flex;",
+    "    align-items: center;",
+    "    margin-bottom: 8px;",
+    "}",
+    ".tweet-author-image {",
+    "    width: 48px;",
+    "    height: 48px;",
+    "    border-radius: 50%;",
+    "    margin-right: 8px;",
+    "}",
+    ".tweet-author-name {",
+    "    font-weight: bold;",
+    "    margin-bottom: 0;",
+    "}",
+    ".tweet-author-username {",
+    "    color: #536471;",
+    "}",
+    ".tweet-text {",
+    "    margin-bottom: 12px;",
+    "}",
+    ".tweet-media {",
+    "    max-width: 100%;",
+    "    border-radius: 12px;",
+    "    margin-bottom: 12px;",
+    "}",
+    ".tweet-date {",
+    "    color: #536471;",
+    "    font-size: 14px;",
+    "    margin-bottom: 12px;",
+    "}",
+    ".tweet-metrics {",
+    "    display: flex;",
+    "    justify-content: space-between;",
+    "    color: #536471;",
+    "}"
+]
+
+STYLE_TAG = f"<style>{''.join(STYLES)}</style>"
+
+_fragments = LRUCache(maxsize=FRAGMENT_CACHE_SIZE)
+_fragments_lock = threading.Lock()
+
+
+def format_date(epoch_ms):
+    tweet_date = datetime.fromtimestamp(epoch_ms / 1000, tz=timezone.utc)
+    return tweet_date.strftime("%I:%M %p · %b %d, %Y")
+
+
+def _render_tweet(tweet):
+    # Everything is emitted on one line: a blank line would end the HTML
+    # block in Streamlit's markdown and spill the rest out as text.
+    author = tweet.author
+    profile_image_url = html.escape(author.profile_image_url or '')
+    name = html.escape(author.name or 'Unknown')
+    username = html.escape(author.username or 'unknown')
+    text = html.escape(tweet.text).replace("\n", "<br>")
+
+    parts = [
+        '<div class="tweet-header">',
+        f'<img src="{profile_image_url}" class="tweet-author-image">',
+        '<div>',
+        f'<p class="tweet-author-name">{name}</p>',
+        f'<p class="tweet-author-username">@{username}</p>',
+        '</div>',
+        '</div>',
+        f'<p class="tweet-text">{text}</p>',
+    ]
+
+    for media_type, url, preview_image_url in tweet.media:
+        if media_type == 'photo':
+            parts.append(
+                f'<img src="{html.escape(url or "")}" class="tweet-media">')
+        elif media_type == 'video':
+            parts.append(
+                '<p>Video content available (cannot be displayed directly)</p>')
+            if preview_image_url:
+                parts.append(
+                    f'<img src="{html.escape(preview_image_url)}" class="tweet-media">')
+
+    if tweet.created_at is not None:
+        parts.append(f'<p class="tweet-date">{format_date(tweet.created_at)}</p>')
+
+    def count(field, default):
+        value = tweet.metric(field)
+        return default if value is None else value
+
+    metrics = [
+        ("🔁", count("retweet_count", 0)),
+        ("💬", count("reply_count", 0)),
+        ("❤️", count("like_count", 0)),
+        ("🔄", count("quote_count", 0)),
+        ("🔖", count("bookmark_count", "N/A")),
+        ("👁️", count("impression_count", "N/A"))
+    ]
+    parts.append('<div class="tweet-metrics">')
+    parts.extend(f'<span>{icon} {value}</span>' for icon, value in metrics)
+    parts.append('</div>')
+    return ''.join(parts)
+
+
+def render_tweet(tweet):
+    # Tweets only change through their metrics, so id + metrics is a safe
+    # key for the rendered fragment.
+    key = (tweet.id, tuple(tweet.metrics))
+    with _fragments_lock:
+        fragment = _fragments.get(key)
+    if fragment is None:
+        fragment = _render_tweet(tweet)
+        with _fragments_lock:
+            _fragments[key] = fragment
+    return fragment
+
+
+def render_thread(thread):
+    parts = []
+    for i, tweet in enumerate(thread):
+        css_class = "referenced-tweet" if i < len(thread) - 1 else "reply-tweet"
+        parts.append(f'<div class="tweet-container {css_class}">')
+        parts.append(render_tweet(tweet))
+        parts.append('</div>')
+
+        if i < len(thread) - 1:
+            username = tweet.author.username or "Unknown"
+            parts.append(
+                f'<p class="replying-to">Replying to @{html.escape(username)}</p>')
+    return ''.join(parts)